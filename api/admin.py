@@ -0,0 +1,145 @@
+# api/admin.py
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from .models import Collect, Payment
+
+# Ниже этой оценки строк в таблице количество считается точным COUNT(*)
+EXACT_COUNT_LIMIT = 10000
+# Сборов в одной пачке массовых действий
+ACTION_CHUNK_SIZE = 1000
+
+
+def estimated_row_count(model, using):
+    """
+    Оценка числа строк таблицы из статистики PostgreSQL (pg_class.reltuples)
+    без чтения таблицы. У секционированной таблицы суммируются секции.
+    Возвращает None, если статистики нет.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT SUM(GREATEST(c.reltuples, 0)), BOOL_OR(c.reltuples >= 0)
+            FROM pg_class c
+            WHERE c.oid = %s::regclass
+               OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = %s::regclass)
+            """,
+            [model._meta.db_table, model._meta.db_table],
+        )
+        estimate, analyzed = cursor.fetchone()
+    return int(estimate) if analyzed else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор списка админки: для списка без фильтров в PostgreSQL берет
+    оценку числа строк вместо COUNT(*) по всей таблице. Отфильтрованные
+    списки и небольшие таблицы считаются точно.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where and connections[queryset.db].vendor == 'postgresql':
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
+
+
+def chunked_pks(queryset, chunk_size=ACTION_CHUNK_SIZE):
+    """Идентификаторы выборки пачками по диапазонам первичного ключа"""
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+    last_pk = None
+    while True:
+        chunk = list((pks if last_pk is None else pks.filter(pk__gt=last_pk))[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1]
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    """Список без точного подсчета всех строк таблицы"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+@admin.register(Collect)
+class CollectAdmin(ScalableModelAdmin):
+    list_display = [
+        'title', 'author', 'occasion', 'total_amount', 'target_amount_cents',
+        'contributors', 'is_active', 'end_datetime', 'created_at',
+    ]
+    list_filter = ['is_active', 'occasion']
+    list_select_related = ['author']
+    search_fields = ['title']
+    date_hierarchy = 'created_at'
+    autocomplete_fields = ['author']
+    readonly_fields = ['collected_amount_cents', 'contributors_count', 'cover_variants', 'created_at', 'updated_at']
+    actions = ['close_collects', 'recompute_totals']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_counters()
+
+    @admin.display(description='Собрано (в копейках)')
+    def total_amount(self, obj):
+        return obj.total_amount_cents
+
+    @admin.display(description='Донатеров')
+    def contributors(self, obj):
+        return obj.total_contributors
+
+    def delete_queryset(self, request, queryset):
+        """
+        Массовое удаление пачками: queryset.delete() обошел бы Collect.delete
+        и оставил в кэше ответы с удаленными сборами
+        """
+        for collect_ids in chunked_pks(queryset):
+            Collect.objects.delete_batch(collect_ids)
+
+    @admin.action(description='Закрыть выбранные сборы')
+    def close_collects(self, request, queryset):
+        """Закрытие пачками: одно изменение и одна вставка событий outbox на пачку"""
+        closed = sum(
+            Collect.objects.close(collect_ids)
+            for collect_ids in chunked_pks(queryset.filter(is_active=True))
+        )
+        self.message_user(request, f'Закрыто сборов: {closed}')
+
+    @admin.action(description='Пересчитать суммы по платежам')
+    def recompute_totals(self, request, queryset):
+        """Сверка с платежами пачками, как в reconcile_collects"""
+        checked = changed = 0
+        for collect_ids in chunked_pks(queryset):
+            changed += len(Collect.objects.reconcile_totals(collect_ids))
+            checked += len(collect_ids)
+        self.message_user(request, f'Проверено сборов: {checked}. Исправлено: {changed}')
+
+
+@admin.register(Payment)
+class PaymentAdmin(ScalableModelAdmin):
+    list_display = ['id', 'collect', 'user', 'amount', 'payment_method', 'is_anonymous', 'created_at']
+    list_filter = ['payment_method']
+    list_select_related = ['collect', 'user']
+    date_hierarchy = 'created_at'
+    raw_id_fields = ['collect']
+    autocomplete_fields = ['user']
+    readonly_fields = ['donor_display_name', 'created_at', 'updated_at']
+
+    def get_readonly_fields(self, request, obj=None):
+        """Сумма и сбор уже учтены в счетчиках, поэтому после создания не меняются"""
+        readonly = super().get_readonly_fields(request, obj)
+        if obj is not None:
+            readonly = [*readonly, 'collect', 'user', 'amount']
+        return readonly
+
+    def delete_queryset(self, request, queryset):
+        """
+        Массовое удаление пачками: queryset.delete() обошел бы Payment.delete,
+        и суммы сборов остались бы с удаленными платежами
+        """
+        for payment_ids in chunked_pks(queryset):
+            Payment.objects.delete_batch(payment_ids)
@@ -0,0 +1,59 @@
+# api/async_views.py
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from rest_framework.renderers import JSONRenderer
+from rest_framework.routers import DefaultRouter
+from .cache import set_validators, aget_cached_response
+from .db_router import is_pinned
+
+
+def _accepts_json(request):
+    """JSON-ответ без согласования DRF: браузеру нужен browsable API"""
+    return (
+        request.GET.get('format') in (None, 'json')
+        and 'text/html' not in request.META.get('HTTP_ACCEPT', '')
+    )
+
+
+def async_read_view(view, name):
+    """
+    Async-обертка DRF-представления для ASGI.
+    GET с актуальной записью в кэше ответов отдается прямо в event loop
+    без соединения с БД, а с Redis и без перехода в поток (кэш читается
+    через redis.asyncio). Остальные запросы, в том числе клиентов,
+    закрепленных за primary, выполняются синхронным представлением в потоке.
+    """
+    sync_view = sync_to_async(view)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method == 'GET' and _accepts_json(request) and not is_pinned(request):
+            cached = await aget_cached_response(name, request)
+            if cached is not None:
+                data, etag, last_modified = cached
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = HttpResponse(JSONRenderer().render(data), content_type='application/json')
+                response['Vary'] = 'Accept'
+                return set_validators(response, etag, last_modified)
+        return await sync_view(request, *args, **kwargs)
+    return wrapper
+
+
+class AsyncReadRouter(DefaultRouter):
+    """Роутер, который под ASGI отдает list/retrieve через async_read_view"""
+
+    def get_urls(self):
+        urls = super().get_urls()
+        if not settings.ASYNC_READ_VIEWS:
+            return urls
+        for url in urls:
+            actions = getattr(url.callback, 'actions', None)
+            if actions and actions.get('get') in ('list', 'retrieve'):
+                basename = url.callback.initkwargs['basename']
+                url.callback = async_read_view(url.callback, f"{basename}:{actions['get']}")
+        return urls
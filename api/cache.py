@@ -0,0 +1,396 @@
+# api/cache.py
+import asyncio
+import hashlib
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache, RedisSerializer
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+from .db_router import is_pinned, replica_read_active
+from .metrics import record_cache_lookup
+
+TAG_PREFIX = 'tag:'
+RESPONSE_PREFIX = 'response:'
+OBJECT_PREFIX = 'object:'
+STATS_PREFIX = 'stats:response:'
+
+# Теги инвалидации:
+#   collects                  - состав списков сборов (создание, удаление и изменение
+#                               полей сбора, по которым идут фильтры и поиск)
+#   collect:<id>              - поля конкретного сбора (сумма, счетчики, описание)
+#   payments                  - состав общего списка платежей
+#   collect:<id>:payments     - состав списка платежей конкретного сбора
+#   collect:<id>:stats        - дневная статистика сбора
+#   payment:<id>              - поля конкретного платежа
+#   rankings                  - ленты trending и near-goal
+COLLECTS_TAG = 'collects'
+PAYMENTS_TAG = 'payments'
+RANKINGS_TAG = 'rankings'
+
+STATS_VIEWS_KEY = STATS_PREFIX + 'views'
+
+# Эндпоинты, уже записанные в общий реестр статистики из этого процесса
+_registered_views = set()
+
+# Версии тегов, снятые до чтения БД в текущем экшене cache_response
+_read_versions = ContextVar('read_versions', default=None)
+
+# Клиенты redis.asyncio по event loop для async-чтения кэша
+_async_clients = {}
+_serializer = RedisSerializer()
+
+
+def collect_tag(collect_id):
+    return f'collect:{collect_id}'
+
+
+def collect_payments_tag(collect_id):
+    return f'collect:{collect_id}:payments'
+
+
+def collect_stats_tag(collect_id):
+    return f'collect:{collect_id}:stats'
+
+
+def payment_tag(payment_id):
+    return f'payment:{payment_id}'
+
+
+def _new_version():
+    """
+    Версия тега - время изменения в наносекундах.
+    Поэтому версия годится для Last-Modified, а после вытеснения тега
+    из кэша старые записи с совпавшей версией не станут снова валидными.
+    """
+    return time.time_ns()
+
+
+def get_tag_versions(tags):
+    """Возвращает текущие версии тегов, создавая отсутствующие"""
+    keys = {tag: TAG_PREFIX + tag for tag in tags}
+    stored = cache.get_many(keys.values())
+    versions = {}
+    for tag, key in keys.items():
+        version = stored.get(key)
+        if version is None:
+            version = _new_version()
+            if not cache.add(key, version, timeout=None):
+                version = cache.get(key, version)
+        versions[tag] = version
+    return versions
+
+
+def replica_safe_timeout(versions, timeout):
+    """
+    Время жизни записи, посчитанной по данным реплики.
+    Если тег изменился меньше REPLICA_LAG_WINDOW секунд назад, реплика могла
+    еще не получить изменение: такая запись живет не дольше этого окна,
+    иначе устаревшие данные остались бы в кэше под новой версией тега.
+    """
+    if not replica_read_active():
+        return timeout
+    window = settings.REPLICA_LAG_WINDOW
+    if max(versions, default=0) > _new_version() - window * 1_000_000_000:
+        return min(timeout, window)
+    return timeout
+
+
+def bump_tags(*tags):
+    """Сдвигает версии тегов, делая устаревшими все связанные записи"""
+    version = _new_version()
+    cache.set_many({TAG_PREFIX + tag: version for tag in tags}, timeout=None)
+
+
+def invalidate_on_commit(*tags):
+    """
+    Инвалидирует теги после фиксации транзакции.
+    Иначе параллельный запрос успеет закэшировать еще не закоммиченное состояние.
+    """
+    transaction.on_commit(lambda: bump_tags(*tags))
+
+
+def get_cached_objects(tags_by_pk, fetch, timeout, variant='', use_cached=True):
+    """
+    Возвращает сериализованные объекты {pk: data} из кэша объектов.
+
+    Ключ объекта содержит версию его тега, снятую до обращения к БД,
+    поэтому запись, посчитанная параллельно с изменением, сразу устаревает.
+    variant разделяет представления одного объекта (сериализатор, набор полей).
+    fetch(pks) сериализует отсутствующие в кэше объекты. С use_cached=False
+    кэш не читается: все объекты берутся из БД и перезаписывают записи.
+    """
+    versions = get_tag_versions(set(tags_by_pk.values()))
+    read_versions = _read_versions.get()
+    if read_versions is not None:
+        for tag, version in versions.items():
+            read_versions.setdefault(tag, version)
+    keys = {
+        pk: f'{OBJECT_PREFIX}{variant}:{tag}:{versions[tag]}'
+        for pk, tag in tags_by_pk.items()
+    }
+    found = cache.get_many(keys.values()) if use_cached else {}
+    result = {pk: found[key] for pk, key in keys.items() if key in found}
+
+    missing = [pk for pk in keys if pk not in result]
+    if missing:
+        fetched = fetch(missing)
+        by_timeout = {}
+        for pk, data in fetched.items():
+            ttl = replica_safe_timeout([versions[tags_by_pk[pk]]], timeout)
+            by_timeout.setdefault(ttl, {})[keys[pk]] = data
+        for ttl, entries in by_timeout.items():
+            cache.set_many(entries, ttl)
+        result.update(fetched)
+    return result
+
+
+def _async_client():
+    """
+    Клиент redis.asyncio того же сервера, что и кэш, для текущего event loop.
+    None, если кэш не в Redis (LocMemCache при локальном запуске).
+    """
+    if not isinstance(caches['default'], RedisCache):
+        return None
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        # Как и RedisCache, пишем на первый сервер из LOCATION
+        location = settings.CACHES['default']['LOCATION'].split(',')[0]
+        client = _async_clients[loop] = aioredis.Redis.from_url(location)
+    return client
+
+
+async def aget_many(keys):
+    """
+    Async-вариант cache.get_many. С Redis читает через redis.asyncio прямо
+    в event loop: async-методы RedisCache - обертки sync_to_async с переходом в поток.
+    Ключи и значения совместимы с RedisCache.
+    """
+    keys = list(keys)
+    client = _async_client()
+    if client is None:
+        return await cache.aget_many(keys)
+    values = await client.mget([cache.make_and_validate_key(key) for key in keys])
+    return {key: _serializer.loads(value) for key, value in zip(keys, values) if value is not None}
+
+
+async def aadd(key, value, timeout):
+    client = _async_client()
+    if client is None:
+        return await cache.aadd(key, value, timeout=timeout)
+    return bool(await client.set(
+        cache.make_and_validate_key(key), _serializer.dumps(value), nx=True,
+        ex=None if timeout is None else max(int(timeout), 1),
+    ))
+
+
+async def aget_tag_versions(tags):
+    """Async-вариант get_tag_versions для чтения кэша без потока"""
+    keys = {tag: TAG_PREFIX + tag for tag in tags}
+    stored = await aget_many(keys.values())
+    versions = {}
+    for tag, key in keys.items():
+        version = stored.get(key)
+        if version is None:
+            version = _new_version()
+            if not await aadd(key, version, timeout=None):
+                version = (await aget_many([key])).get(key, version)
+        versions[tag] = version
+    return versions
+
+
+def incr_counter(key, delta=1):
+    """Атомарно увеличивает счетчик в кэше, создавая его при отсутствии"""
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        if cache.add(key, delta, timeout=None):
+            return delta
+        return cache.incr(key, delta)
+
+
+async def aincr_counter(key, delta=1):
+    client = _async_client()
+    if client is None:
+        try:
+            return await cache.aincr(key, delta)
+        except ValueError:
+            if await cache.aadd(key, delta, timeout=None):
+                return delta
+            return await cache.aincr(key, delta)
+    # RedisCache хранит целые без сериализации, INCRBY создает отсутствующий
+    # счетчик без срока жизни, как incr_counter
+    return await client.incrby(cache.make_and_validate_key(key), delta)
+
+
+def _register_view(name):
+    """Запоминает эндпоинт в общем реестре, чтобы статистику видели другие процессы"""
+    if name in _registered_views:
+        return
+    views = cache.get(STATS_VIEWS_KEY, set())
+    cache.set(STATS_VIEWS_KEY, views | {name}, timeout=None)
+    _registered_views.add(name)
+
+
+def _view_name(view):
+    return f'{view.basename}:{view.action}'
+
+
+def _response_key(name, request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'{RESPONSE_PREFIX}{name}:{path}'
+
+
+def _validators(request, versions):
+    """ETag и Last-Modified ответа по версиям его тегов, без сериализации"""
+    accept = request.META.get('HTTP_ACCEPT', '')
+    digest = hashlib.md5(f'{sorted(versions.items())}{accept}'.encode()).hexdigest()
+    last_modified = max(versions.values(), default=0) // 1_000_000_000
+    return quote_etag(digest), last_modified
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def _versions_before_read(tags, started):
+    """
+    Версии тегов ответа, снятые до чтения БД, или None, если ответ
+    нельзя кэшировать. Тег, версию которого не сняли заранее, принимается,
+    только если он не менялся с начала экшена.
+    """
+    read_versions = _read_versions.get()
+    versions = {tag: read_versions[tag] for tag in tags if tag in read_versions}
+    missing = [tag for tag in tags if tag not in versions]
+    if missing:
+        current = get_tag_versions(missing)
+        if max(current.values()) >= started:
+            return None
+        versions.update(current)
+    return versions
+
+
+def cache_response(timeout, tags=None, static_tags=None):
+    """
+    Кэширует данные ответа DRF-экшена с тегированной инвалидацией.
+
+    static_tags(view) возвращает теги, известные до чтения БД (состав
+    списков), tags(view, data) - теги объектов ответа. Запись считается
+    валидной, пока версии всех ее тегов не изменились, поэтому изменение
+    одного сбора не сбрасывает кэш остальных.
+
+    Запись сохраняется под версиями, снятыми до чтения БД: версии тегов
+    известных заранее читаются перед экшеном, версии объектов - в
+    get_cached_objects. Иначе данные, прочитанные до параллельной записи,
+    попали бы в кэш под уже новой версией тега.
+
+    Версии тегов также дают ETag/Last-Modified: на If-None-Match и
+    If-Modified-Since отвечаем 304 по одному обращению к кэшу.
+
+    Клиент, закрепленный за primary после своей записи, кэш не читает:
+    запись могла быть посчитана на реплике, еще не получившей его изменение.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            name = _view_name(view)
+            _register_view(name)
+            key = _response_key(name, request)
+
+            entry = None if is_pinned(request) else cache.get(key)
+            if entry is not None and get_tag_versions(entry['tags']) == entry['tags']:
+                incr_counter(f'{STATS_PREFIX}{name}:hits')
+                record_cache_lookup(hit=True)
+                etag, last_modified = _validators(request, entry['tags'])
+                not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if not_modified is not None:
+                    return set_validators(not_modified, etag, last_modified)
+                return set_validators(Response(entry['data']), etag, last_modified)
+
+            incr_counter(f'{STATS_PREFIX}{name}:misses')
+            record_cache_lookup(hit=False)
+            token = _read_versions.set(get_tag_versions(static_tags(view) if static_tags else []))
+            started = _new_version()
+            try:
+                response = method(view, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                dependencies = [
+                    *(static_tags(view) if static_tags else []),
+                    *(tags(view, response.data) if tags else []),
+                ]
+                versions = _versions_before_read(dependencies, started)
+            finally:
+                _read_versions.reset(token)
+            if versions is None:
+                return response
+
+            cache.set(
+                key, {'tags': versions, 'data': response.data},
+                replica_safe_timeout(versions.values(), timeout),
+            )
+            etag, last_modified = _validators(request, versions)
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return set_validators(not_modified, etag, last_modified)
+            return set_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+async def aget_cached_response(name, request):
+    """
+    Читает ответ, закэшированный cache_response для эндпоинта name
+    (basename:action), только async-вызовами кэша.
+    Возвращает (data, etag, last_modified) или None, если записи нет или она устарела.
+    """
+    key = _response_key(name, request)
+    entry = (await aget_many([key])).get(key)
+    if entry is None or await aget_tag_versions(entry['tags']) != entry['tags']:
+        return None
+    await aincr_counter(f'{STATS_PREFIX}{name}:hits')
+    record_cache_lookup(hit=True)
+    etag, last_modified = _validators(request, entry['tags'])
+    return entry['data'], etag, last_modified
+
+
+def response_items(data):
+    """Элементы ответа с учетом пагинации"""
+    if isinstance(data, dict) and 'results' in data:
+        return data['results']
+    if isinstance(data, list):
+        return data
+    return [data]
+
+
+def response_cache_stats():
+    """Счетчики попаданий и промахов по каждому закэшированному эндпоинту"""
+    stats = {}
+    for name in sorted(cache.get(STATS_VIEWS_KEY, set())):
+        counters = cache.get_many([f'{STATS_PREFIX}{name}:hits', f'{STATS_PREFIX}{name}:misses'])
+        hits = counters.get(f'{STATS_PREFIX}{name}:hits', 0)
+        misses = counters.get(f'{STATS_PREFIX}{name}:misses', 0)
+        total = hits + misses
+        stats[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / total if total else 0.0,
+        }
+    return stats
+
+
+def reset_response_cache_stats():
+    cache.delete_many(
+        f'{STATS_PREFIX}{name}:{counter}'
+        for name in cache.get(STATS_VIEWS_KEY, set())
+        for counter in ('hits', 'misses')
+    )
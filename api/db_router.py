@@ -0,0 +1,92 @@
+# api/db_router.py
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Cookie с моментом, до которого клиент читает только с primary
+PIN_COOKIE = 'primary_pinned_until'
+
+# Алиас реплики для чтения в текущем запросе, None - читать с primary
+read_alias = ContextVar('replica_read_alias', default=None)
+
+
+def replica_read_active():
+    return read_alias.get() is not None
+
+
+def is_pinned(request):
+    """
+    Клиент недавно писал и должен видеть свои изменения: читает с primary
+    и не получает кэш, который мог быть посчитан на отстающей реплике
+    """
+    if not settings.REPLICA_DATABASES:
+        return False
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def choose_replica(request):
+    """Реплика для чтений запроса или None, если читать нужно с primary"""
+    if not settings.REPLICA_DATABASES or is_pinned(request):
+        return None
+    return random.choice(settings.REPLICA_DATABASES)
+
+
+class ReplicaRouter:
+    """
+    Чтения в экшенах, явно разрешенных ReplicaReadMixin, идут на одну
+    реплику из REPLICA_DATABASES, выбранную на весь запрос. Остальные
+    чтения (изменяющие запросы, админка, задачи Celery, команды) и все
+    записи идут на default.
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class PrimaryPinMiddleware:
+    """
+    После успешного изменяющего запроса закрепляет клиента за primary на
+    REPLICA_LAG_WINDOW секунд, чтобы он увидел свою запись, пока реплики
+    ее догоняют. Работает и под WSGI, и под ASGI без перехода в поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _pin(self, request, response):
+        if (
+            settings.REPLICA_DATABASES
+            and request.method not in ('GET', 'HEAD', 'OPTIONS')
+            and response.status_code < 400
+        ):
+            window = settings.REPLICA_LAG_WINDOW
+            response.set_cookie(PIN_COOKIE, str(time.time() + window), max_age=window, httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._pin(request, await self.get_response(request))
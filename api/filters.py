@@ -0,0 +1,112 @@
+# api/filters.py
+from datetime import datetime, time
+
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+from .models import Collect
+
+TRUE_VALUES = ('1', 'true', 'yes')
+FALSE_VALUES = ('0', 'false', 'no')
+
+
+def parse_occasions(params):
+    """Поводы из ?occasion=birthday,wedding или None, если фильтр не задан"""
+    occasion = params.get('occasion')
+    if not occasion:
+        return None
+    occasions = [value.strip() for value in occasion.split(',') if value.strip()]
+    unknown = set(occasions) - set(Collect.Occasion.values)
+    if unknown:
+        raise ValidationError({'occasion': f"Неизвестный повод: {', '.join(sorted(unknown))}"})
+    return occasions
+
+
+class CollectFilterBackend(BaseFilterBackend):
+    """
+    Поиск и фильтры списка сборов:
+    ?search= - слова из названия или описания,
+    ?occasion=birthday,wedding, ?is_active=true,
+    ?end_datetime_after= и ?end_datetime_before= - диапазон даты завершения.
+
+    Фильтры ложатся на индексы (occasion) и (is_active, end_datetime),
+    поиск в PostgreSQL - на GIN-индекс поискового вектора.
+    """
+
+    def _parse_datetime(self, name, value):
+        parsed = parse_datetime(value)
+        if parsed is None:
+            date = parse_date(value)
+            if date is None:
+                raise ValidationError({name: 'Ожидается дата ГГГГ-ММ-ДД или дата и время в ISO 8601'})
+            parsed = datetime.combine(date, time.min)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    def filter_queryset(self, request, queryset, view):
+        if view.action != 'list':
+            return queryset
+        params = request.query_params
+
+        occasions = parse_occasions(params)
+        if occasions:
+            queryset = queryset.filter(occasion__in=occasions)
+
+        is_active = params.get('is_active')
+        if is_active:
+            if is_active.lower() not in TRUE_VALUES + FALSE_VALUES:
+                raise ValidationError({'is_active': 'Ожидается true или false'})
+            queryset = queryset.filter(is_active=is_active.lower() in TRUE_VALUES)
+
+        end_after = params.get('end_datetime_after')
+        if end_after:
+            queryset = queryset.filter(end_datetime__gte=self._parse_datetime('end_datetime_after', end_after))
+        end_before = params.get('end_datetime_before')
+        if end_before:
+            queryset = queryset.filter(end_datetime__lte=self._parse_datetime('end_datetime_before', end_before))
+
+        search = params.get('search', '').strip()
+        if search:
+            queryset = queryset.search(search)
+        return queryset
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': 'search',
+                'required': False,
+                'in': 'query',
+                'description': 'Поиск по названию и описанию',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': 'occasion',
+                'required': False,
+                'in': 'query',
+                'description': 'Поводы через запятую',
+                'schema': {'type': 'string', 'example': 'birthday,wedding'},
+            },
+            {
+                'name': 'is_active',
+                'required': False,
+                'in': 'query',
+                'description': 'Только активные (true) или завершенные (false) сборы',
+                'schema': {'type': 'boolean'},
+            },
+            {
+                'name': 'end_datetime_after',
+                'required': False,
+                'in': 'query',
+                'description': 'Дата завершения не раньше',
+                'schema': {'type': 'string', 'format': 'date-time'},
+            },
+            {
+                'name': 'end_datetime_before',
+                'required': False,
+                'in': 'query',
+                'description': 'Дата завершения не позже',
+                'schema': {'type': 'string', 'format': 'date-time'},
+            },
+        ]
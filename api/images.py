@@ -0,0 +1,80 @@
+# api/images.py
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+# Форматы вариантов: расширение -> (формат Pillow, параметры сохранения)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Файл слишком большой'
+    default_code = 'upload_too_large'
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    """
+    Пишет загружаемые файлы сразу во временный файл на диске, без буфера
+    в памяти, и прерывает загрузку при превышении UPLOAD_MAX_FILE_SIZE
+    """
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.UPLOAD_MAX_FILE_SIZE:
+            self.file.close()
+            raise UploadTooLarge(f'Размер файла не должен превышать {filesizeformat(settings.UPLOAD_MAX_FILE_SIZE)}')
+        return super().receive_data_chunk(raw_data, start)
+
+
+def validate_cover_dimensions(file):
+    """Проверяет размеры обложки по заголовку файла, не декодируя изображение"""
+    width, height = file.image.size
+    limit = settings.COVER_IMAGE_MAX_DIMENSION
+    if width > limit or height > limit:
+        return f'Размер изображения не должен превышать {limit}x{limit} пикселей'
+    return None
+
+
+def variant_name(original_name, variant, extension):
+    """Путь варианта рядом с оригиналом: covers/<имя>_<вариант>.<формат>"""
+    root, _ = os.path.splitext(original_name)
+    return f'{root}_{variant}.{extension}'
+
+
+def render_variants(file):
+    """
+    Уменьшенные копии обложки для всех размеров COVER_IMAGE_VARIANTS.
+    Поворот из EXIF применяется к пикселям, а сами метаданные
+    (EXIF, GPS, ICC) в варианты не попадают.
+    Возвращает {вариант: {'width': ширина, расширение: ContentFile}}.
+    """
+    with Image.open(file) as source:
+        image = ImageOps.exif_transpose(source).convert('RGB')
+
+    variants = {}
+    widths = set()
+    for variant, width in settings.COVER_IMAGE_VARIANTS.items():
+        resized = image.copy()
+        # Только уменьшение: маленькие обложки не растягиваются,
+        # а совпавшие по ширине варианты не дублируются
+        resized.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+        if resized.width in widths:
+            continue
+        widths.add(resized.width)
+        rendered = {'width': resized.width}
+        for extension, (image_format, params) in VARIANT_FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, image_format, **params)
+            rendered[extension] = ContentFile(buffer.getvalue())
+        variants[variant] = rendered
+    return variants
@@ -0,0 +1,210 @@
+# api/live.py
+"""
+Живой прогресс сборов через Server-Sent Events.
+
+После коммита в Redis-канал LIVE_CHANNEL публикуется только идентификатор
+изменившегося сбора. Новые платежи публикует обработчик outbox (drain_outbox),
+а не запрос платежа; закрытие, сверка, правка сбора и удаление платежей
+публикуются после своего коммита. Каждый ASGI-воркер держит одну
+подписку на канал (ProgressHub) и раздает обновления своим клиентам:
+изменения копятся и не чаще LIVE_UPDATES_PER_SECOND раз в секунду
+читаются одним запросом для всех сборов с подписчиками этого воркера.
+Ожидающий клиент - это корутина и очередь, а не поток или соединение с БД.
+"""
+import asyncio
+import json
+import logging
+import uuid
+
+import redis
+import redis.asyncio as aioredis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections, transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+
+log = logging.getLogger(__name__)
+
+LIVE_CHANNEL = 'live:collects'
+
+_publisher = None
+_hubs = {}
+
+
+def _get_publisher():
+    global _publisher
+    if _publisher is None:
+        _publisher = redis.Redis.from_url(settings.LIVE_REDIS_URL, socket_timeout=1)
+    return _publisher
+
+
+def publish_progress(*collect_ids):
+    """
+    Сообщает подписчикам об изменении сборов. Ошибка Redis не должна
+    ломать платеж: обновление придет со следующим изменением сбора.
+    """
+    if not settings.LIVE_REDIS_URL:
+        return
+    if not collect_ids:
+        return
+    try:
+        # Все сборы пачки outbox - за одно обращение к Redis
+        pipeline = _get_publisher().pipeline(transaction=False)
+        for collect_id in collect_ids:
+            pipeline.publish(LIVE_CHANNEL, str(collect_id))
+        pipeline.execute()
+    except redis.RedisError as exc:
+        log.warning(f"Не удалось опубликовать прогресс сборов: {exc}")
+
+
+def publish_progress_on_commit(*collect_ids):
+    """Как invalidate_on_commit: подписчики не увидят незакоммиченные суммы"""
+    transaction.on_commit(lambda: publish_progress(*collect_ids))
+
+
+def load_progress(collect_ids):
+    """Текущие суммы сборов с учетом шардов счетчиков: {id: данные события}"""
+    from .models import Collect
+
+    try:
+        return {
+            collect.pk: {
+                'id': str(collect.pk),
+                'collected_amount_cents': collect.total_amount_cents,
+                'contributors_count': collect.total_contributors,
+                'target_amount_cents': collect.target_amount_cents,
+                'is_active': collect.is_active,
+            }
+            for collect in Collect.objects.filter(pk__in=collect_ids).with_counters().only(
+                'pk', 'collected_amount_cents', 'contributors_count', 'target_amount_cents', 'is_active'
+            )
+        }
+    finally:
+        # Вне запроса соединение само не закроется и не вернется в пул
+        close_old_connections()
+
+
+class ProgressHub:
+    """Подписка воркера на Redis-канал и раздача обновлений его клиентам"""
+
+    def __init__(self):
+        self.subscribers = {}
+        self.dirty = set()
+        self.changed = asyncio.Event()
+        self.tasks = []
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self.listen()), asyncio.create_task(self.flush_loop())]
+
+    def subscribe(self, collect_id):
+        # Хранится только последнее состояние: медленный клиент пропускает
+        # промежуточные обновления, а не копит их
+        queue = asyncio.Queue(maxsize=1)
+        self.subscribers.setdefault(collect_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, collect_id, queue):
+        queues = self.subscribers.get(collect_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[collect_id]
+
+    def mark_changed(self, collect_id):
+        if collect_id in self.subscribers:
+            self.dirty.add(collect_id)
+            self.changed.set()
+
+    async def listen(self):
+        """Читает канал, при обрыве переподключается и обновляет всех подписчиков"""
+        while True:
+            client = aioredis.Redis.from_url(settings.LIVE_REDIS_URL)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(LIVE_CHANNEL)
+                    for collect_id in self.subscribers:
+                        self.mark_changed(collect_id)
+                    async for message in pubsub.listen():
+                        if message['type'] != 'message':
+                            continue
+                        try:
+                            self.mark_changed(uuid.UUID(message['data'].decode()))
+                        except ValueError:
+                            continue
+            except redis.RedisError as exc:
+                log.warning(f"Подписка на прогресс сборов прервана: {exc}")
+                await asyncio.sleep(1)
+            finally:
+                await client.aclose()
+
+    async def flush_loop(self):
+        """Не чаще LIVE_UPDATES_PER_SECOND раз в секунду рассылает накопленные изменения"""
+        interval = 1 / settings.LIVE_UPDATES_PER_SECOND
+        while True:
+            await self.changed.wait()
+            self.changed.clear()
+            dirty, self.dirty = self.dirty, set()
+            try:
+                progress = await sync_to_async(load_progress)(dirty)
+            except Exception:
+                log.exception('Не удалось прочитать прогресс сборов')
+                progress = {}
+            for collect_id, data in progress.items():
+                for queue in self.subscribers.get(collect_id, ()):
+                    if queue.full():
+                        queue.get_nowait()
+                    queue.put_nowait(data)
+            await asyncio.sleep(interval)
+
+
+def get_hub():
+    """Хаб текущего event loop: один на воркер"""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = ProgressHub()
+        hub.start()
+    return hub
+
+
+def _event(data):
+    return f'event: progress\ndata: {json.dumps(data)}\n\n'
+
+
+async def progress_events(collect_id, initial):
+    hub = get_hub()
+    queue = hub.subscribe(collect_id)
+    try:
+        yield _event(initial)
+        while True:
+            try:
+                data = await asyncio.wait_for(queue.get(), settings.LIVE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Комментарий SSE не дает прокси закрыть простаивающее соединение
+                yield ': ping\n\n'
+                continue
+            yield _event(data)
+    finally:
+        hub.unsubscribe(collect_id, queue)
+
+
+async def collect_progress_stream(request, pk):
+    """
+    GET /collects/{id}/live/ - поток событий progress со суммой и числом
+    донатеров сбора. Первое событие - текущее состояние.
+    Работает только под ASGI (WEB_SERVER=asgi) и с Redis (LIVE_REDIS_URL).
+    """
+    if request.method != 'GET':
+        return HttpResponse(status=405, headers={'Allow': 'GET'})
+    if not settings.LIVE_REDIS_URL or not isinstance(request, ASGIRequest):
+        return HttpResponse('Живые обновления доступны только под ASGI с Redis', status=503)
+
+    initial = (await sync_to_async(load_progress)([pk])).get(pk)
+    if initial is None:
+        raise Http404
+    response = StreamingHttpResponse(progress_events(pk, initial), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx не должен буферизовать поток
+    response['X-Accel-Buffering'] = 'no'
+    return response
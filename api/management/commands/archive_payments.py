@@ -0,0 +1,116 @@
+# api/management/commands/archive_payments.py
+import gzip
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from api.cache import PAYMENTS_TAG, collect_payments_tag, collect_tag, invalidate_on_commit
+from api.exports import payment_export_rows, stream_csv
+from api.models import Collect, Payment
+from api.partitioning import drop_empty_partitions, month_start
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит платежи давно закрытых сборов в архивные файлы CSV.gz и удаляет их из БД. '
+        'Суммы и статистика сборов сохраняются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.PAYMENT_ARCHIVE_AFTER_DAYS,
+            help='Архивировать сборы, закрытые больше этого числа дней назад'
+        )
+        parser.add_argument('--output-dir', default=settings.PAYMENT_ARCHIVE_DIR, help='Каталог архива')
+        parser.add_argument('--limit', type=int, help='Максимум сборов за запуск')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать сборы для архивации')
+        parser.add_argument(
+            '--drop-empty-partitions',
+            action='store_true',
+            help='Удалить опустевшие секции платежей старше --days (PostgreSQL)'
+        )
+
+    def archive_collect(self, collect_id, directory):
+        """
+        Выгружает платежи сбора в файл и удаляет их.
+        Файл пишется до удаления, а удаление откатывается, если удалено
+        не столько строк, сколько выгружено. Возвращает число платежей или None.
+        """
+        path = os.path.join(directory, f'{collect_id}.csv.gz')
+        payments = Payment.objects.filter(collect_id=collect_id).order_by('created_at', 'id')
+        written = 0
+
+        def counted(rows):
+            nonlocal written
+            for row in rows:
+                written += 1
+                yield row
+
+        with gzip.open(f'{path}.tmp', 'wt', encoding='utf-8', newline='') as file:
+            for chunk in stream_csv(counted(payment_export_rows(payments, settings.EXPORT_CHUNK_SIZE))):
+                file.write(chunk)
+        os.replace(f'{path}.tmp', path)
+
+        with transaction.atomic():
+            Collect.objects.select_for_update().filter(pk=collect_id).values_list('pk').get()
+            # Без сигналов и каскадов удаление идет одним DELETE, счетчики сбора не меняются
+            deleted, _ = Payment.objects.filter(collect_id=collect_id).delete()
+            if deleted != written:
+                transaction.set_rollback(True)
+                self.stderr.write(f'{collect_id}: выгружено {written}, а удалялось бы {deleted} платежей, пропущен')
+                return None
+            Collect.objects.filter(pk=collect_id).update(payments_archived_at=timezone.now())
+            invalidate_on_commit(collect_tag(collect_id), collect_payments_tag(collect_id), PAYMENTS_TAG)
+        return written
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days должен быть положительным')
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        # Закрытие сбора обновляет updated_at, поэтому он задает давность закрытия
+        collect_ids = (
+            Collect.objects.filter(
+                is_active=False,
+                payments_archived_at__isnull=True,
+                updated_at__lt=cutoff,
+                end_datetime__lt=cutoff,
+            )
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+        if options['limit']:
+            collect_ids = collect_ids[:options['limit']]
+
+        if options['dry_run']:
+            count = 0
+            for collect_id in collect_ids.iterator():
+                self.stdout.write(f'{collect_id}: {Payment.objects.filter(collect_id=collect_id).count()} платежей')
+                count += 1
+            self.stdout.write(self.style.SUCCESS(f'Сборов для архивации: {count}'))
+            return
+
+        directory = os.path.join(options['output_dir'], 'payments')
+        os.makedirs(directory, exist_ok=True)
+        collects = payments = 0
+        for collect_id in list(collect_ids):
+            archived = self.archive_collect(collect_id, directory)
+            if archived is None:
+                continue
+            collects += 1
+            payments += archived
+            self.stdout.write(f'{collect_id}: {archived} платежей')
+
+        if options['drop_empty_partitions']:
+            with transaction.atomic():
+                dropped = drop_empty_partitions(connection, month_start(cutoff))
+            for name in dropped:
+                self.stdout.write(f'Удалена пустая секция {name}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Архивировано сборов: {collects}, платежей: {payments}. Файлы в {directory}'
+        ))
@@ -0,0 +1,126 @@
+# api/management/commands/backfill_collect_stats.py
+import uuid
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from api.cache import collect_stats_tag, invalidate_on_commit
+from api.models import Collect, CollectDailyStat, CollectHourlyAmount, OutboxEvent, Payment, trend_hour
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает дневную статистику и почасовые суммы сборов по платежам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Пересчитать только дни начиная с даты (ГГГГ-ММ-ДД)')
+        parser.add_argument(
+            '--collect',
+            action='append',
+            default=[],
+            help='Идентификатор сбора (можно указать несколько раз)'
+        )
+        parser.add_argument('--chunk-size', type=int, default=500, help='Размер пачки сборов')
+
+    def backfill_chunk(self, collect_ids, since):
+        """
+        Пересчитывает статистику пачки сборов и почасовые суммы за окно
+        тренда (они нужны только за TRENDING_WINDOW, поэтому без --since).
+        Строки сборов блокируются так же, как в обработчике outbox, а платежи
+        с еще не обработанными событиями пропускаются: их добавит обработчик.
+        """
+        with transaction.atomic():
+            list(
+                Collect.objects.select_for_update(no_key=True)
+                .filter(pk__in=collect_ids).order_by('pk').values_list('pk')
+            )
+
+            pending = OutboxEvent.objects.pending().filter(
+                event_type=OutboxEvent.EventType.PAYMENT_CREATED
+            ).values('object_id')
+            payments = Payment.objects.filter(collect_id__in=collect_ids).exclude(pk__in=pending)
+            self.backfill_hourly(collect_ids, payments)
+            stats = CollectDailyStat.objects.filter(collect_id__in=collect_ids)
+            if since:
+                payments = payments.filter(created_at__date__gte=since)
+                stats = stats.filter(day__gte=since)
+
+            rows = (
+                payments
+                .annotate(day=TruncDate('created_at'))
+                .order_by()
+                .values('collect_id', 'day', 'payment_method')
+                .annotate(amount=Sum('amount'), count=Count('id'), contributors=Count('user'))
+            )
+            stats.delete()
+            created = CollectDailyStat.objects.bulk_create(
+                (
+                    CollectDailyStat(
+                        collect_id=row['collect_id'],
+                        day=row['day'],
+                        payment_method=row['payment_method'],
+                        amount_cents=int(row['amount'] * 100),
+                        payments_count=row['count'],
+                        contributors=row['contributors'],
+                    )
+                    for row in rows.iterator(chunk_size=2000)
+                ),
+                batch_size=1000,
+            )
+            invalidate_on_commit(*(collect_stats_tag(collect_id) for collect_id in collect_ids))
+        return len(created)
+
+    def backfill_hourly(self, collect_ids, payments):
+        window_start = trend_hour(timezone.now() - timedelta(seconds=settings.TRENDING_WINDOW))
+        rows = (
+            payments.filter(created_at__gte=window_start)
+            .annotate(hour=TruncHour('created_at', tzinfo=dt_timezone.utc))
+            .order_by()
+            .values('collect_id', 'hour')
+            .annotate(amount=Sum('amount'))
+        )
+        CollectHourlyAmount.objects.filter(collect_id__in=collect_ids).delete()
+        CollectHourlyAmount.objects.bulk_create(
+            (
+                CollectHourlyAmount(collect_id=row['collect_id'], hour=row['hour'], amount_cents=int(row['amount'] * 100))
+                for row in rows.iterator(chunk_size=2000)
+            ),
+            batch_size=1000,
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError(f"Некорректная дата --since: {options['since']}")
+
+        # Статистика архивных сборов остается, а платежей для пересчета уже нет
+        queryset = (
+            Collect.objects.filter(payments_archived_at__isnull=True)
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+        if options['collect']:
+            try:
+                queryset = queryset.filter(pk__in=[uuid.UUID(collect_id) for collect_id in options['collect']])
+            except ValueError as exc:
+                raise CommandError(f'Некорректный идентификатор сбора: {exc}')
+
+        collects = buckets = 0
+        last_pk = None
+        while True:
+            chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            collect_ids = list(chunk[:options['chunk_size']])
+            if not collect_ids:
+                break
+
+            buckets += self.backfill_chunk(collect_ids, since)
+            collects += len(collect_ids)
+            last_pk = collect_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Обработано сборов: {collects}, записей статистики: {buckets}'))
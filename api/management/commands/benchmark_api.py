@@ -0,0 +1,289 @@
+# api/management/commands/benchmark_api.py
+import json
+import platform
+import statistics
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from api.models import Collect, CollectCounterShard, Payment
+
+# Бюджет SQL-запросов на один запрос к эндпоинту: cold - пустой кэш,
+# warm - повторный запрос, который должен отдаваться из кэша
+QUERY_BUDGETS = {
+    'collect-list': {'cold': 3, 'warm': 0},
+    'collect-retrieve': {'cold': 1, 'warm': 0},
+    'collect-stats': {'cold': 2, 'warm': 0},
+    'payment-list': {'cold': 3, 'warm': 0},
+    'payment-list-collect': {'cold': 3, 'warm': 0},
+    'payment-retrieve': {'cold': 1, 'warm': 0},
+    'collect-create': {'cold': 6},
+    # 7 запросов, 10 при первой записи в шард счетчика (INSERT в savepoint)
+    'payment-create': {'cold': 10},
+}
+
+# Кэш только для бенчмарка: cold-замеры очищают его целиком
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+
+def summarize(latencies, elapsed):
+    """Перцентили задержки в миллисекундах и пропускная способность"""
+    if not latencies:
+        return {'requests': 0}
+    millis = sorted(latency * 1000 for latency in latencies)
+    cuts = statistics.quantiles(millis, n=100, method='inclusive') if len(millis) > 1 else millis * 99
+    return {
+        'requests': len(millis),
+        'p50_ms': round(cuts[49], 3),
+        'p95_ms': round(cuts[94], 3),
+        'p99_ms': round(cuts[98], 3),
+        'max_ms': round(millis[-1], 3),
+        'rps': round(len(millis) / elapsed, 1) if elapsed else None,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку, пропускную способность и число SQL-запросов эндпоинтов '
+        'сборов и платежей. Создает данные, поэтому запускать на отдельной БД.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='',
+            help='Объемы платежей через запятую (например 10000,100000): '
+                 'перед каждым замером БД досевается до этого объема. По умолчанию - текущие данные'
+        )
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на эндпоинт')
+        parser.add_argument('--warmup', type=int, default=10, help='Прогревочных запросов на эндпоинт')
+        parser.add_argument('--concurrency', type=int, default=8, help='Потоков в тесте горячего сбора')
+        parser.add_argument('--hot-requests', type=int, default=400, help='Платежей в тесте горячего сбора')
+        parser.add_argument('--seed', type=int, default=42, help='Зерно для seed_data')
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument('--no-budgets', action='store_true', help='Не проверять бюджеты запросов')
+
+    def scenarios(self):
+        """Эндпоинты: имя -> (метод, путь, тело, кэшируется ли ответ)"""
+        collect = Collect.objects.order_by('-collected_amount_cents', 'pk').first()
+        payment = Payment.objects.filter(collect=collect).order_by('-created_at').first()
+        user = User.objects.order_by('pk').first()
+        if collect is None or payment is None:
+            raise CommandError('Нет данных для замеров: запустите seed_data или укажите --sizes')
+        self.hot_collect = collect
+
+        def collect_body():
+            return {
+                'author': user.pk,
+                'title': 'Бенчмарк',
+                'occasion': Collect.Occasion.OTHER,
+                'description': 'Сбор, созданный бенчмарком',
+                'end_datetime': (timezone.now() + timedelta(days=30)).isoformat(),
+            }
+
+        def payment_body():
+            return {
+                'user': user.pk,
+                'collect': str(collect.pk),
+                'amount': '100.00',
+                'payment_method': Payment.PaymentMethod.CARD,
+            }
+
+        return {
+            'collect-list': ('get', '/collects/', None, True),
+            'collect-retrieve': ('get', f'/collects/{collect.pk}/', None, True),
+            'collect-stats': ('get', f'/collects/{collect.pk}/stats/', None, True),
+            'payment-list': ('get', '/payments/', None, True),
+            'payment-list-collect': ('get', f'/payments/?collect={collect.pk}', None, True),
+            'payment-retrieve': ('get', f'/payments/{payment.pk}/', None, True),
+            'collect-create': ('post', '/collects/', collect_body, False),
+            'payment-create': ('post', '/payments/', payment_body, False),
+        }
+
+    def request(self, client, method, path, body):
+        if method == 'get':
+            return client.get(path)
+        return client.post(path, data=json.dumps(body()), content_type='application/json')
+
+    def measure(self, client, name, method, path, body, cold, count, check_budget=True):
+        latencies = []
+        queries = []
+        statuses = set()
+        elapsed = 0.0
+        for _ in range(count):
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = self.request(client, method, path, body)
+                latency = time.perf_counter() - started
+            elapsed += latency
+            latencies.append(latency)
+            queries.append(len(captured))
+            statuses.add(response.status_code)
+
+        result = summarize(latencies, elapsed)
+        result.update(queries_min=min(queries), queries_max=max(queries), statuses=sorted(statuses))
+
+        mode = 'cold' if cold else 'warm'
+        budget = QUERY_BUDGETS.get(name, {}).get(mode)
+        if budget is not None and check_budget:
+            result['query_budget'] = budget
+            if result['queries_max'] > budget:
+                self.violations.append(f'{name} ({mode}): {result["queries_max"]} запросов при бюджете {budget}')
+        return result
+
+    def benchmark_endpoints(self, options):
+        client = Client()
+        results = {}
+        for name, (method, path, body, cached) in self.scenarios().items():
+            self.measure(client, name, method, path, body, cached, options['warmup'], check_budget=False)
+            results[name] = {'cold': self.measure(client, name, method, path, body, True, options['requests'])}
+            if cached:
+                results[name]['warm'] = self.measure(client, name, method, path, body, False, options['requests'])
+            self.stdout.write(f'  {name}: {self.format_result(results[name])}')
+        return results
+
+    def benchmark_hot_collect(self, options):
+        """Параллельные платежи в один сбор из нескольких потоков со своими соединениями"""
+        collect = self.hot_collect
+        user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True)[:options['concurrency']])
+        per_thread = max(options['hot_requests'] // options['concurrency'], 1)
+        amount_before = collect.payments.aggregate(total=Sum('amount'))['total'] or Decimal(0)
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker(index):
+            client = Client()
+            body = {
+                'user': user_ids[index % len(user_ids)],
+                'collect': str(collect.pk),
+                'amount': '10.00',
+                'payment_method': Payment.PaymentMethod.SBP,
+            }
+            try:
+                for _ in range(per_thread):
+                    started = time.perf_counter()
+                    try:
+                        response = client.post('/payments/', data=json.dumps(body), content_type='application/json')
+                        status = response.status_code
+                    except Exception as exc:
+                        status = type(exc).__name__
+                    latency = time.perf_counter() - started
+                    with lock:
+                        latencies.append(latency)
+                        if status != 201:
+                            errors.append(status)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(options['concurrency'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        # Счетчики сбора после свертки шардов должны совпасть с суммой платежей
+        CollectCounterShard.objects.rollup()
+        collect.refresh_from_db()
+        amount_after = collect.payments.aggregate(total=Sum('amount'))['total'] or Decimal(0)
+        created = len(latencies) - len(errors)
+
+        result = summarize(latencies, elapsed)
+        result.update(
+            concurrency=options['concurrency'],
+            errors=len(errors),
+            error_statuses=sorted({str(status) for status in errors}),
+            created=created,
+            amount_delta_consistent=amount_after - amount_before == Decimal('10.00') * created,
+            counters_consistent=collect.collected_amount_cents == int(amount_after * 100),
+        )
+        self.stdout.write(f'  hot-collect: {self.format_result({"concurrent": result})}, ошибок {len(errors)}')
+        if not result['counters_consistent']:
+            self.violations.append('hot-collect: счетчики сбора разошлись с суммой платежей')
+        return result
+
+    def format_result(self, modes):
+        return '; '.join(
+            f"{mode} p50={result['p50_ms']}ms p95={result['p95_ms']}ms p99={result['p99_ms']}ms "
+            f"{result['rps']} rps" + (f" q={result['queries_max']}" if 'queries_max' in result else '')
+            for mode, result in modes.items() if result['requests']
+        )
+
+    def seed_to(self, payments, index, seed):
+        """Досевает БД до заданного числа платежей"""
+        missing = payments - Payment.objects.count()
+        if missing <= 0:
+            return
+        call_command(
+            'seed_data',
+            users=max(missing // 10, 10),
+            collects=max(missing // 25, 10),
+            payments=missing,
+            seed=seed + index,
+            user_prefix=f'bench{payments}_',
+            stdout=self.stdout,
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError(f"Некорректный --sizes: {options['sizes']}")
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests и --concurrency должны быть положительными')
+
+        self.violations = []
+        runs = []
+        started_at = timezone.now().isoformat()
+        with override_settings(CACHES=BENCHMARK_CACHES):
+            for index, size in enumerate(sizes or [None]):
+                if size is not None:
+                    self.seed_to(size, index, options['seed'])
+                counts = {'payments': Payment.objects.count(), 'collects': Collect.objects.count()}
+                self.stdout.write(f"Платежей {counts['payments']}, сборов {counts['collects']}")
+                runs.append({
+                    **counts,
+                    'endpoints': self.benchmark_endpoints(options),
+                    'hot_collect': self.benchmark_hot_collect(options),
+                })
+
+        report = {
+            'meta': {
+                'started_at': started_at,
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+            },
+            'runs': runs,
+            'budget_violations': self.violations,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Результаты записаны в {options['output']}")
+
+        if self.violations and not options['no_budgets']:
+            raise CommandError('Превышены бюджеты:\n' + '\n'.join(self.violations))
+        self.stdout.write(self.style.SUCCESS('Бюджеты запросов соблюдены'))
@@ -0,0 +1,27 @@
+# api/management/commands/cache_stats.py
+from django.core.management.base import BaseCommand
+from api.cache import reset_response_cache_stats, response_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и промахи кэша ответов по эндпоинтам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Обнулить счетчики')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            reset_response_cache_stats()
+            self.stdout.write('Счетчики кэша обнулены')
+            return
+
+        stats = response_cache_stats()
+        if not stats:
+            self.stdout.write('Статистика кэша пуста')
+            return
+
+        for name, counters in stats.items():
+            self.stdout.write(
+                f"{name}: попаданий {counters['hits']}, промахов {counters['misses']}, "
+                f"hit ratio {counters['hit_ratio']:.1%}"
+            )
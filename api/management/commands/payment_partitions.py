@@ -0,0 +1,49 @@
+# api/management/commands/payment_partitions.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from api.partitioning import (
+    ensure_partitions,
+    is_partitioned,
+    partition_payments,
+    payment_partitions,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Помесячные секции таблицы платежей (PostgreSQL): создает секции '
+        'на будущие месяцы и показывает существующие'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=settings.PAYMENT_PARTITIONS_AHEAD,
+            help='На сколько месяцев вперед создать секции'
+        )
+        parser.add_argument(
+            '--convert',
+            action='store_true',
+            help='Перевести обычную таблицу платежей на секции (блокирует таблицу на время копирования)'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Секционирование поддерживается только в PostgreSQL')
+
+        with transaction.atomic():
+            if options['convert'] and partition_payments(connection, options['months_ahead']):
+                self.stdout.write('Таблица платежей переведена на помесячные секции')
+            if not is_partitioned(connection):
+                raise CommandError('Таблица платежей не секционирована: запустите с --convert')
+            created = ensure_partitions(connection, options['months_ahead'])
+
+        for name in created:
+            self.stdout.write(f'Создана секция {name}')
+        with connection.cursor() as cursor:
+            for name, _ in payment_partitions(connection):
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [name])
+                self.stdout.write(f'{name}: ~{max(cursor.fetchone()[0], 0)} строк')
+        self.stdout.write(self.style.SUCCESS('Секции платежей в порядке'))
@@ -0,0 +1,78 @@
+# api/management/commands/reconcile_collects.py
+import uuid
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from api.models import Collect, Payment
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает собранную сумму и количество донатеров сборов по платежам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать расхождения')
+        parser.add_argument(
+            '--since',
+            help='Проверять только сборы, измененные или получившие платежи с этой даты (ISO)'
+        )
+        parser.add_argument(
+            '--collect',
+            action='append',
+            default=[],
+            help='Идентификатор сбора (можно указать несколько раз)'
+        )
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Размер пачки сборов')
+
+    def parse_since(self, value):
+        since = parse_datetime(value)
+        if since is None:
+            date = parse_date(value)
+            if date is None:
+                raise CommandError(f'Некорректная дата --since: {value}')
+            since = datetime.combine(date, time.min)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return since
+
+    def get_queryset(self, options):
+        queryset = Collect.objects.all()
+        if options['collect']:
+            try:
+                collect_ids = [uuid.UUID(collect_id) for collect_id in options['collect']]
+            except ValueError as exc:
+                raise CommandError(f'Некорректный идентификатор сбора: {exc}')
+            queryset = queryset.filter(pk__in=collect_ids)
+        if options['since']:
+            since = self.parse_since(options['since'])
+            recent_payments = Payment.objects.filter(collect=OuterRef('pk'), updated_at__gte=since)
+            queryset = queryset.filter(Q(updated_at__gte=since) | Exists(recent_payments))
+        return queryset
+
+    def reconcile_chunk(self, collect_ids, dry_run):
+        """Исправляет расхождения пачки сборов, возвращает количество исправленных"""
+        deltas = Collect.objects.reconcile_totals(collect_ids, dry_run=dry_run)
+        for collect_id, (amount_delta, contributors_delta) in deltas.items():
+            self.stdout.write(f"{collect_id}: сумма {amount_delta:+d} коп., донатеры {contributors_delta:+d}")
+        return len(deltas)
+
+    def handle(self, *args, **options):
+        queryset = self.get_queryset(options).order_by('pk').values_list('pk', flat=True)
+        chunk_size = options['chunk_size']
+
+        checked = changed = 0
+        last_pk = None
+        while True:
+            chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            collect_ids = list(chunk[:chunk_size])
+            if not collect_ids:
+                break
+
+            changed += self.reconcile_chunk(collect_ids, options['dry_run'])
+            checked += len(collect_ids)
+            last_pk = collect_ids[-1]
+
+        action = 'Найдено расхождений' if options['dry_run'] else 'Исправлено сборов'
+        self.stdout.write(self.style.SUCCESS(f'Проверено сборов: {checked}. {action}: {changed}'))
@@ -1,34 +1,220 @@
 # api/management/commands/seed_data.py
-from django.core.management.base import BaseCommand
-from django.utils import timezone
-from django.contrib.auth.models import User
-from django.db import transaction
+import bisect
+import itertools
 import random
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import timedelta
 from decimal import Decimal
-from api.models import Collect, Payment
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from api.models import Collect, CollectRanking, Payment
+
+PAYMENT_METHOD_WEIGHTS = {
+    Payment.PaymentMethod.CARD: 60,
+    Payment.PaymentMethod.SBP: 25,
+    Payment.PaymentMethod.YOOMONEY: 8,
+    Payment.PaymentMethod.QIWI: 4,
+    Payment.PaymentMethod.OTHER: 3,
+}
+
+
+@contextmanager
+def manual_timestamps(*models):
+    """Отключает auto_now/auto_now_add, чтобы задать даты сгенерированных строк"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class ZipfSampler:
+    """Выбор индекса 0..n-1 с вероятностью ~ 1 / (rank + 1) ** skew"""
+
+    def __init__(self, rng, n, skew):
+        self.rng = rng
+        self.cum_weights = list(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(n)))
+        # Ранги перемешаны, чтобы горячие объекты не совпадали с первыми созданными
+        self.order = list(range(n))
+        rng.shuffle(self.order)
+
+    def sample(self):
+        point = self.rng.random() * self.cum_weights[-1]
+        return self.order[bisect.bisect_left(self.cum_weights, point)]
 
 
 class Command(BaseCommand):
-    help = 'Создает тестовые данные: 2000 пользователей, 2000 сборов, 5000 платежей'
+    help = (
+        'Создает детерминированные тестовые данные для нагрузочного тестирования: '
+        'пользователей, сборы и платежи с перекосом в популярные сборы'
+    )
 
-    def handle(self, *args, **options):
-        with transaction.atomic():
-            users = [User.objects.create_user(f'user{i}', 'pass') for i in range(2001)]
-            collects = [Collect.objects.create(
-                author=random.choice(users),
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000, help='Количество пользователей')
+        parser.add_argument('--collects', type=int, default=2000, help='Количество сборов')
+        parser.add_argument('--payments', type=int, default=5000, help='Количество платежей')
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора случайных чисел')
+        parser.add_argument(
+            '--collect-skew',
+            type=float,
+            default=1.1,
+            help='Показатель Zipf для сборов: чем больше, тем сильнее платежи идут в несколько горячих сборов'
+        )
+        parser.add_argument('--donor-skew', type=float, default=0.8, help='Показатель Zipf для донатеров')
+        parser.add_argument('--days', type=int, default=90, help='Глубина истории платежей в днях')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Размер пачки bulk_create')
+        parser.add_argument('--user-prefix', default='user', help='Префикс логинов пользователей')
+        parser.add_argument('--skip-stats', action='store_true', help='Не пересчитывать дневную статистику и рейтинги сборов')
+
+    def chunks(self, iterable, size):
+        iterator = iter(iterable)
+        while chunk := list(itertools.islice(iterator, size)):
+            yield chunk
+
+    def make_uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def random_datetime(self, start, end):
+        return start + (end - start) * self.rng.random()
+
+    def create_users(self, count, prefix, chunk_size):
+        # PBKDF2 считается один раз: у всех пользователей пароль 'pass'
+        password = make_password('pass')
+        user_ids = []
+        users = (User(username=f'{prefix}{i}', password=password) for i in range(count))
+        for chunk in self.chunks(users, chunk_size):
+            with transaction.atomic():
+                user_ids += [user.pk for user in User.objects.bulk_create(chunk)]
+        return user_ids
+
+    def create_collects(self, count, user_ids, chunk_size):
+        collect_ids = []
+        created_at = []
+        occasions = Collect.Occasion.values
+        collects = (
+            Collect(
+                id=self.make_uuid(),
+                author_id=self.rng.choice(user_ids),
                 title=f'Сбор {i}',
-                occasion='birthday',
-                target_amount_cents=500000,
-                end_datetime=timezone.now() + timedelta(days=30)
-            ) for i in range(2001)]
-
-            Payment.objects.bulk_create([
-                Payment(user=random.choice(users), collect=random.choice(collects),
-                        amount=Decimal('1000'), payment_method='card')
-                for _ in range(5001)
-            ])
-
-        print("Создано 2000 пользователей")
-        print("Создано 2000 сборов")
-        print("Создано 5000 платежей")
+                occasion=self.rng.choice(occasions),
+                description=f'Описание сбора {i}',
+                target_amount_cents=self.rng.choice([None, 500000, 2000000, 10000000]),
+                created_at=(created := self.random_datetime(self.history_start, self.now)),
+                updated_at=created,
+                end_datetime=created + timedelta(days=self.rng.randint(7, 120)),
+            )
+            for i in range(count)
+        )
+        for chunk in self.chunks(collects, chunk_size):
+            with transaction.atomic():
+                Collect.objects.bulk_create(chunk)
+            collect_ids += [collect.pk for collect in chunk]
+            created_at += [collect.created_at for collect in chunk]
+        return collect_ids, created_at
+
+    def create_payments(self, count, user_ids, collect_ids, collect_created_at, options, chunk_size):
+        """Создает платежи и возвращает итоги {индекс сбора: [сумма, донатеры]}"""
+        collect_sampler = ZipfSampler(self.rng, len(collect_ids), options['collect_skew'])
+        donor_sampler = ZipfSampler(self.rng, len(user_ids), options['donor_skew'])
+        methods, method_weights = list(PAYMENT_METHOD_WEIGHTS), list(PAYMENT_METHOD_WEIGHTS.values())
+        totals = {}
+
+        def generate():
+            for _ in range(count):
+                collect_index = collect_sampler.sample()
+                # 5% платежей от гостей без пользователя
+                user_index = donor_sampler.sample() if self.rng.random() >= 0.05 else None
+                amount_cents = min(max(int(self.rng.lognormvariate(11, 1)), 100), 10_000_000)
+                created = self.random_datetime(collect_created_at[collect_index], self.now)
+
+                amount, contributors = totals.get(collect_index, (0, 0))
+                totals[collect_index] = (amount + amount_cents, contributors + (user_index is not None))
+
+                yield Payment(
+                    id=self.make_uuid(),
+                    user_id=user_ids[user_index] if user_index is not None else None,
+                    donor_display_name=f"{options['user_prefix']}{user_index}" if user_index is not None else None,
+                    collect_id=collect_ids[collect_index],
+                    amount=Decimal(amount_cents) / 100,
+                    payment_method=self.rng.choices(methods, method_weights)[0],
+                    is_anonymous=self.rng.random() < 0.1,
+                    created_at=created,
+                    updated_at=created,
+                )
+
+        created = 0
+        for chunk in self.chunks(generate(), chunk_size):
+            with transaction.atomic():
+                Payment.objects.bulk_create(chunk)
+            created += len(chunk)
+            self.stdout.write(f'  платежей: {created}/{count}', ending='\r')
+        self.stdout.write('')
+        return totals
+
+    def update_counters(self, collect_ids, totals, chunk_size):
+        """Записывает в сборы суммы сгенерированных платежей"""
+        collects = (
+            Collect(pk=collect_ids[index], collected_amount_cents=amount, contributors_count=contributors)
+            for index, (amount, contributors) in totals.items()
+        )
+        for chunk in self.chunks(collects, chunk_size):
+            with transaction.atomic():
+                Collect.objects.bulk_update(chunk, ['collected_amount_cents', 'contributors_count'])
+
+    def stage(self, title, func, *args, **kwargs):
+        started = time.monotonic()
+        result = func(*args, **kwargs)
+        self.stdout.write(f'{title}: {time.monotonic() - started:.1f} с')
+        return result
+
+    def handle(self, *args, **options):
+        if min(options['users'], options['collects']) < 1:
+            raise CommandError('Нужен хотя бы один пользователь и один сбор')
+        if User.objects.filter(username__startswith=options['user_prefix']).exists():
+            raise CommandError(
+                f"Пользователи с префиксом '{options['user_prefix']}' уже есть, укажите другой --user-prefix"
+            )
+
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        self.history_start = self.now - timedelta(days=options['days'])
+        chunk_size = options['chunk_size']
+
+        # bulk_create не отправляет post_save: для тестовых данных не создаются
+        # события outbox и письма
+        with manual_timestamps(Collect, Payment):
+            user_ids = self.stage(
+                f"Создано пользователей {options['users']}",
+                self.create_users, options['users'], options['user_prefix'], chunk_size,
+            )
+            collect_ids, collect_created_at = self.stage(
+                f"Создано сборов {options['collects']}",
+                self.create_collects, options['collects'], user_ids, chunk_size,
+            )
+            totals = self.stage(
+                f"Создано платежей {options['payments']}",
+                self.create_payments, options['payments'], user_ids, collect_ids, collect_created_at,
+                options, chunk_size,
+            )
+        self.stage('Обновлены суммы сборов', self.update_counters, collect_ids, totals, chunk_size)
+
+        if not options['skip_stats']:
+            self.stage(
+                'Пересчитана дневная статистика',
+                call_command, 'backfill_collect_stats', stdout=self.stdout,
+            )
+            self.stage('Пересчитаны рейтинги сборов', CollectRanking.objects.refresh)
@@ -0,0 +1,296 @@
+# api/metrics.py
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from celery import signals
+from django.conf import settings
+from django.core.cache import cache
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+METRICS_PREFIX = 'metrics:'
+METRICS_SERIES_KEY = METRICS_PREFIX + 'series'
+
+# Границы бакетов гистограмм в секундах
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Метрики со временем хранятся в микросекундах: в кэше счетчики целые
+HELP = {
+    'http_requests_total': ('counter', 'Запросы по маршруту, методу и статусу'),
+    'http_request_duration_seconds': ('histogram', 'Время обработки запроса'),
+    'http_db_queries_total': ('counter', 'SQL-запросы, выполненные при обработке запросов'),
+    'http_db_query_seconds_total': ('counter', 'Время SQL-запросов'),
+    'http_serializer_seconds_total': ('counter', 'Время сериализаторов DRF'),
+    'http_response_cache_total': ('counter', 'Обращения к кэшу ответов по результату'),
+    'celery_task_runs_total': ('counter', 'Выполнения задач Celery по итоговому состоянию'),
+    'celery_task_runtime_seconds': ('histogram', 'Время выполнения задачи Celery'),
+    'celery_task_queue_latency_seconds': ('histogram', 'Время ожидания задачи в очереди'),
+}
+
+_current = ContextVar('request_metrics', default=None)
+
+# Накопленные в процессе приращения {ключ серии: значение}
+_pending = {}
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+# Серии, уже записанные в общий реестр из этого процесса
+_registered_series = set()
+# Время начала выполняемых задач Celery по task_id
+_task_started = {}
+
+
+class RequestMetrics:
+    """Счетчики одного запроса: SQL, кэш ответов и сериализация"""
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.serializer_time = 0.0
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.db_queries += 1
+
+    def server_timing(self, total):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"',
+            f'cache;desc="hit={self.cache_hits} miss={self.cache_misses}"',
+            f'serializer;dur={self.serializer_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+def _series(name, **labels):
+    if not labels:
+        return name
+    return name + '|' + ','.join(f'{label}={value}' for label, value in sorted(labels.items()))
+
+
+def _add(series, value):
+    with _pending_lock:
+        _pending[series] = _pending.get(series, 0) + value
+
+
+def _observe(name, seconds, **labels):
+    """Наблюдение гистограммы: кумулятивные бакеты, сумма и количество"""
+    for bound in DURATION_BUCKETS:
+        _add(_series(name + '_bucket', le=bound, **labels), int(seconds <= bound))
+    _add(_series(name + '_bucket', le='+Inf', **labels), 1)
+    _add(_series(name + '_sum', **labels), int(seconds * 1_000_000))
+    _add(_series(name + '_count', **labels), 1)
+
+
+def flush_due():
+    return time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL
+
+
+def flush(force=False):
+    """
+    Переносит накопленные приращения в общий кэш.
+    Запись идет не чаще раза в METRICS_FLUSH_INTERVAL секунд, поэтому
+    обработка запроса обходится без обращений к кэшу.
+    """
+    global _pending, _last_flush
+    now = time.monotonic()
+    if not force and not flush_due():
+        return
+    with _pending_lock:
+        pending, _pending = _pending, {}
+        _last_flush = now
+    if not pending:
+        return
+
+    from .cache import incr_counter
+
+    for series, value in pending.items():
+        incr_counter(METRICS_PREFIX + series, value)
+
+    new_series = pending.keys() - _registered_series
+    if new_series:
+        registry = cache.get(METRICS_SERIES_KEY, set())
+        if not new_series <= registry:
+            cache.set(METRICS_SERIES_KEY, registry | new_series, timeout=None)
+        _registered_series.update(new_series)
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats.db_wrapper(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def _install_db_wrapper(sender, connection, **kwargs):
+    """
+    Обертка SQL ставится на каждое соединение любого потока и берет метрики
+    запроса из контекста. Под ASGI синхронное представление выполняется
+    в потоке sync_to_async со своими соединениями, а контекст туда копируется.
+    """
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+@contextmanager
+def track_request():
+    """Собирает метрики запроса, включая SQL на всех соединениях"""
+    stats = RequestMetrics()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def serializer_timer():
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_time += time.perf_counter() - started
+
+
+def record_cache_lookup(hit):
+    stats = _current.get()
+    if stats is None:
+        return
+    if hit:
+        stats.cache_hits += 1
+    else:
+        stats.cache_misses += 1
+
+
+def record_request(route, method, status, stats, duration):
+    _add(_series('http_requests_total', route=route, method=method, status=status), 1)
+    _observe('http_request_duration_seconds', duration, route=route)
+    if stats.db_queries:
+        _add(_series('http_db_queries_total', route=route), stats.db_queries)
+        _add(_series('http_db_query_seconds_total', route=route), int(stats.db_time * 1_000_000))
+    if stats.serializer_time:
+        _add(_series('http_serializer_seconds_total', route=route), int(stats.serializer_time * 1_000_000))
+    if stats.cache_hits:
+        _add(_series('http_response_cache_total', route=route, result='hit'), stats.cache_hits)
+    if stats.cache_misses:
+        _add(_series('http_response_cache_total', route=route, result='miss'), stats.cache_misses)
+
+
+def _sort_key(series):
+    """Серии по имени и меткам, бакеты гистограмм - по возрастанию границы"""
+    name, _, labels = series.partition('|')
+    pairs = [pair.split('=', 1) for pair in labels.split(',') if pair]
+    bound = next((float(value) for label, value in pairs if label == 'le'), 0.0)
+    return name, [pair for pair in pairs if pair[0] != 'le'], bound
+
+
+def _format_value(name, value):
+    if name.endswith(('_seconds_total', '_seconds_sum')):
+        return f'{value / 1_000_000:.6f}'
+    return str(value)
+
+
+def render():
+    """Метрики всех процессов в текстовом формате Prometheus"""
+    flush(force=True)
+    registry = sorted(cache.get(METRICS_SERIES_KEY, set()), key=_sort_key)
+    values = cache.get_many([METRICS_PREFIX + series for series in registry])
+
+    families = {}
+    for series in registry:
+        name, _, labels = series.partition('|')
+        family = next((base for base in HELP if name == base or name.startswith(base + '_')), name)
+        label_text = ','.join(
+            f'{label}="{value}"' for label, value in (pair.split('=', 1) for pair in labels.split(',') if pair)
+        )
+        value = values.get(METRICS_PREFIX + series, 0)
+        line = f'{name}{{{label_text}}}' if label_text else name
+        families.setdefault(family, []).append(f'{line} {_format_value(name, value)}')
+
+    lines = []
+    for family, samples in families.items():
+        kind, description = HELP.get(family, ('untyped', ''))
+        lines += [f'# HELP {family} {description}', f'# TYPE {family} {kind}', *samples]
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """
+    Метрики запросов: число и время SQL, попадания в кэш ответов, время
+    сериализаторов. Отдает их в заголовке Server-Timing и копит по маршрутам
+    для /metrics. Работает и под WSGI, и под ASGI без перехода в поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _finish(self, request, response, stats, started):
+        duration = time.perf_counter() - started
+        response['Server-Timing'] = stats.server_timing(duration)
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+        record_request(route, request.method, response.status_code, stats, duration)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        with track_request() as stats:
+            response = self.get_response(request)
+        self._finish(request, response, stats, started)
+        flush()
+        return response
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+
+        started = time.perf_counter()
+        with track_request() as stats:
+            response = await self.get_response(request)
+        self._finish(request, response, stats, started)
+        if flush_due():
+            await sync_to_async(flush)()
+        return response
+
+
+@signals.task_prerun.connect
+def _task_prerun(task_id=None, task=None, **kwargs):
+    now = time.time()
+    _task_started[task_id] = time.perf_counter()
+    published_at = getattr(task.request, 'published_at', None)
+    if published_at:
+        _observe('celery_task_queue_latency_seconds', max(now - published_at, 0), task=task.name)
+
+
+@signals.task_postrun.connect
+def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        _observe('celery_task_runtime_seconds', time.perf_counter() - started, task=task.name)
+    _add(_series('celery_task_runs_total', task=task.name, state=state or 'UNKNOWN'), 1)
+    flush()
+
+
+@signals.worker_process_shutdown.connect
+def _worker_shutdown(**kwargs):
+    flush(force=True)
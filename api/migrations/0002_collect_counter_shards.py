@@ -0,0 +1,29 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='Номер шарда')),
+                ('amount_cents', models.BigIntegerField(default=0, verbose_name='Несвернутая сумма (в копейках)')),
+                ('contributors', models.IntegerField(default=0, verbose_name='Несвернутое количество донатеров')),
+                ('collect', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='api.collect', verbose_name='Сбор')),
+            ],
+            options={
+                'verbose_name': 'Шард счетчиков сбора',
+                'verbose_name_plural': 'Шарды счетчиков сборов',
+                'constraints': [models.UniqueConstraint(fields=('collect', 'shard'), name='api_counter_shard_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_collect_counter_shards'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='collect',
+            index=models.Index(fields=['created_at', 'id'], name='api_collect_created_fdee3c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['created_at', 'id'], name='api_payment_created_cf3397_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def fill_donor_display_name(apps, schema_editor):
+    """Заполняет снимок имени донатера у существующих платежей пачками"""
+    Payment = apps.get_model('api', 'Payment')
+    pending = (
+        Payment.objects
+        .filter(user__isnull=False, donor_display_name__isnull=True)
+        .select_related('user')
+        .only('id', 'user__first_name', 'user__last_name', 'user__username')
+        .order_by('id')
+    )
+
+    last_id = None
+    while True:
+        batch = pending if last_id is None else pending.filter(id__gt=last_id)
+        payments = list(batch[:BATCH_SIZE])
+        if not payments:
+            break
+
+        for payment in payments:
+            user = payment.user
+            full_name = f"{user.first_name or ''} {user.last_name or ''}".strip()
+            payment.donor_display_name = full_name if full_name else user.username
+        Payment.objects.bulk_update(payments, ['donor_display_name'])
+        last_id = payments[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_feed_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='donor_display_name',
+            field=models.CharField(blank=True, editable=False, max_length=301, null=True, verbose_name='Имя донатера на момент платежа'),
+        ),
+        migrations.RunPython(fill_donor_display_name, migrations.RunPython.noop),
+    ]
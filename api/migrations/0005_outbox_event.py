@@ -0,0 +1,27 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_payment_donor_display_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('collect_created', 'Сбор создан'), ('payment_created', 'Платеж создан')], max_length=50, verbose_name='Тип события')),
+                ('object_id', models.UUIDField(verbose_name='Идентификатор объекта')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Событие outbox',
+                'verbose_name_plural': 'События outbox',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_outbox_event'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='event_type',
+            field=models.CharField(choices=[('collect_created', 'Сбор создан'), ('collect_closed', 'Сбор завершен'), ('payment_created', 'Платеж создан')], max_length=50, verbose_name='Тип события'),
+        ),
+    ]
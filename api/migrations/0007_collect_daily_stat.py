@@ -0,0 +1,32 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_outbox_collect_closed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('payment_method', models.CharField(choices=[('card', 'Банковская карта'), ('sbp', 'СБП'), ('qiwi', 'QIWI'), ('yoomoney', 'ЮMoney'), ('other', 'Другое')], max_length=50, verbose_name='Способ оплаты')),
+                ('amount_cents', models.BigIntegerField(default=0, verbose_name='Сумма (в копейках)')),
+                ('payments_count', models.PositiveIntegerField(default=0, verbose_name='Количество платежей')),
+                ('contributors', models.PositiveIntegerField(default=0, verbose_name='Количество донатеров')),
+                ('collect', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='api.collect', verbose_name='Сбор')),
+            ],
+            options={
+                'verbose_name': 'Дневная статистика сбора',
+                'verbose_name_plural': 'Дневная статистика сборов',
+                'ordering': ['collect', 'day'],
+                'constraints': [models.UniqueConstraint(fields=('collect', 'day', 'payment_method'), name='api_collect_daily_stat_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 10:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_collect_daily_stat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collect',
+            name='cover_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Уменьшенные варианты обложки'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.9 on 2026-10-18 12:10
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+INDEX_NAME = 'collect_search_gin'
+
+
+def search_index():
+    # То же выражение, что COLLECT_SEARCH_VECTOR в api.models
+    return GinIndex(SearchVector('title', 'description', config='russian'), name=INDEX_NAME)
+
+
+def add_search_index(apps, schema_editor):
+    """GIN-индекс поиска только для PostgreSQL: в SQLite поиск идет без индекса"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.add_index(apps.get_model('api', 'Collect'), search_index())
+
+
+def remove_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.remove_index(apps.get_model('api', 'Collect'), search_index())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_collect_cover_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_index, remove_search_index),
+    ]
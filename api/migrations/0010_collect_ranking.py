@@ -0,0 +1,29 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_collect_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectRanking',
+            fields=[
+                ('collect', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='api.collect', verbose_name='Сбор')),
+                ('occasion', models.CharField(choices=[('birthday', 'День рождения'), ('wedding', 'Свадьба'), ('medical', 'Медицинское лечение'), ('charity', 'Благотворительность'), ('education', 'Образование'), ('business', 'Бизнес'), ('other', 'Другое')], max_length=50, verbose_name='Повод сбора')),
+                ('trending_amount_cents', models.BigIntegerField(default=0, verbose_name='Сумма платежей за окно тренда (в копейках)')),
+                ('goal_progress', models.FloatField(blank=True, null=True, verbose_name='Доля собранной суммы от цели')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата пересчета')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг сбора',
+                'verbose_name_plural': 'Рейтинги сборов',
+                'indexes': [models.Index(fields=['-trending_amount_cents', 'collect'], name='api_ranking_trending'), models.Index(fields=['occasion', '-trending_amount_cents', 'collect'], name='api_ranking_occ_trending'), models.Index(condition=models.Q(('goal_progress__isnull', False)), fields=['-goal_progress', 'collect'], name='api_ranking_near_goal'), models.Index(condition=models.Q(('goal_progress__isnull', False)), fields=['occasion', '-goal_progress', 'collect'], name='api_ranking_occ_near_goal')],
+            },
+        ),
+    ]
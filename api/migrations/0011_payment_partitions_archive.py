@@ -0,0 +1,32 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+from api.partitioning import partition_payments, unpartition_payments
+
+
+def partition(apps, schema_editor):
+    """Секционирование только в PostgreSQL и только при PAYMENT_PARTITIONING"""
+    if settings.PAYMENT_PARTITIONING:
+        partition_payments(schema_editor.connection, settings.PAYMENT_PARTITIONS_AHEAD)
+
+
+def unpartition(apps, schema_editor):
+    unpartition_payments(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_collect_ranking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collect',
+            name='payments_archived_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Суммы сбора сохранены, сами платежи выгружены командой archive_payments', null=True, verbose_name='Платежи перенесены в архив'),
+        ),
+        migrations.RunPython(partition, unpartition),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_payment_partitions_archive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='collectcountershard',
+            index=models.Index(condition=models.Q(('amount_cents', 0), ('contributors', 0), _negated=True), fields=['collect'], name='api_counter_shard_pending'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_counter_shard_pending_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, help_text='Событие удаляется после отправки его писем', null=True, verbose_name='Статистика обновлена'),
+        ),
+    ]
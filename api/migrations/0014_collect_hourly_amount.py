@@ -0,0 +1,66 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:46
+
+from datetime import timedelta, timezone as dt_timezone
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+
+def fill_hourly_amounts(apps, schema_editor):
+    """
+    Почасовые суммы за текущее окно тренда, чтобы лента trending не
+    опустела после миграции. Платежи с необработанными событиями outbox
+    добавит обработчик.
+    """
+    Payment = apps.get_model('api', 'Payment')
+    OutboxEvent = apps.get_model('api', 'OutboxEvent')
+    CollectHourlyAmount = apps.get_model('api', 'CollectHourlyAmount')
+
+    window_start = timezone.now() - timedelta(seconds=settings.TRENDING_WINDOW)
+    window_start = window_start.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    rows = (
+        Payment.objects
+        .filter(created_at__gte=window_start)
+        .exclude(pk__in=OutboxEvent.objects.filter(event_type='payment_created').values('object_id'))
+        .annotate(hour=TruncHour('created_at', tzinfo=dt_timezone.utc))
+        .order_by()
+        .values('collect_id', 'hour')
+        .annotate(amount=Sum('amount'))
+    )
+    CollectHourlyAmount.objects.bulk_create(
+        (
+            CollectHourlyAmount(collect_id=row['collect_id'], hour=row['hour'], amount_cents=int(row['amount'] * 100))
+            for row in rows.iterator(chunk_size=2000)
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_outbox_event_processed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectHourlyAmount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(verbose_name='Начало часа')),
+                ('amount_cents', models.BigIntegerField(default=0, verbose_name='Сумма (в копейках)')),
+                ('collect', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_amounts', to='api.collect', verbose_name='Сбор')),
+            ],
+            options={
+                'verbose_name': 'Почасовая сумма сбора',
+                'verbose_name_plural': 'Почасовые суммы сборов',
+                'indexes': [models.Index(fields=['hour'], name='api_collect_hourly_hour')],
+                'constraints': [models.UniqueConstraint(fields=('collect', 'hour'), name='api_collect_hourly_amount_unique')],
+            },
+        ),
+        migrations.RunPython(fill_hourly_amounts, migrations.RunPython.noop),
+    ]
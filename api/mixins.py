@@ -0,0 +1,151 @@
+import hashlib
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import Http404
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from .cache import get_cached_objects
+from .db_router import choose_replica, is_pinned, read_alias
+
+
+class CachedObjectsMixin:
+    """
+    Собирает ответы list/retrieve из закэшированных сериализованных объектов.
+
+    Список читает из БД только идентификаторы страницы, а недостающие
+    в кэше объекты сериализует одним запросом.
+    """
+    object_cache_timeout = 60 * 10
+    object_tag = None
+    # Поля строк страницы: id и позиция курсора для KeysetPagination
+    page_fields = ('id', 'created_at')
+
+    def get_object_cache_variant(self):
+        """Представления разных сериализаторов кэшируются отдельно"""
+        return self.get_serializer_class().__name__
+
+    def get_serialized_objects(self, pks):
+        """Сериализованные объекты в порядке pks"""
+        def fetch(missing):
+            instances = list(self.get_queryset().filter(pk__in=missing))
+            serializer = self.get_serializer(instances, many=True)
+            return {instance.pk: data for instance, data in zip(instances, serializer.data)}
+
+        tags_by_pk = {pk: self.object_tag(pk) for pk in pks}
+        cached = get_cached_objects(
+            tags_by_pk, fetch, self.object_cache_timeout, self.get_object_cache_variant(),
+            use_cached=not is_pinned(self.request),
+        )
+        return [cached[pk] for pk in pks if pk in cached]
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).values(*self.page_fields)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            pks = [row['id'] for row in page]
+            return self.get_paginated_response(self.get_serialized_objects(pks))
+
+        return Response(self.get_serialized_objects([row['id'] for row in queryset]))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            pk = self.get_queryset().model._meta.pk.to_python(kwargs[lookup_url_kwarg])
+        except DjangoValidationError:
+            raise Http404
+
+        data = self.get_serialized_objects([pk])
+        if not data:
+            raise Http404
+        return Response(data[0])
+
+
+class SparseFieldsetsMixin:
+    """
+    Разреженные наборы полей для list/retrieve: ?fields=a,b оставляет только
+    перечисленные поля, ?omit=c убирает поля. Запрос к БД сужается через
+    only() до колонок, нужных оставшимся полям сериализатора.
+
+    Колонки поля берутся из Meta.field_columns сериализатора, а для полей
+    модели - из source. Если колонки поля неизвестны, запрос не сужается.
+    """
+    sparse_actions = ('list', 'retrieve')
+
+    def _fields_param(self, name):
+        value = self.request.query_params.get(name, '')
+        return [field.strip() for field in value.split(',') if field.strip()]
+
+    def get_sparse_fields(self):
+        """Выбранные поля в порядке сериализатора или None, если нужны все"""
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = None
+            if self.request is not None and getattr(self, 'action', None) in self.sparse_actions:
+                available = list(self.get_serializer_class()().fields)
+                requested, omitted = self._fields_param('fields'), self._fields_param('omit')
+                unknown = set(requested + omitted) - set(available)
+                if unknown:
+                    raise ValidationError({'fields': f"Неизвестные поля: {', '.join(sorted(unknown))}"})
+                if requested or omitted:
+                    # id нужен тегам инвалидации и клиенту
+                    keep = (set(requested or available) - set(omitted)) | {'id'}
+                    self._sparse_fields = [name for name in available if name in keep]
+        return self._sparse_fields
+
+    def get_sparse_columns(self):
+        """Колонки модели для полей ответа или None, если их не определить"""
+        if not hasattr(self, '_sparse_columns'):
+            serializer = self.get_serializer_class()(context={'sparse_fields': self.get_sparse_fields()})
+            model = serializer.Meta.model
+            field_columns = getattr(serializer.Meta, 'field_columns', {})
+            concrete = {field.name for field in model._meta.concrete_fields}
+
+            columns = {model._meta.pk.name}
+            for name, field in serializer.fields.items():
+                sources = field_columns.get(name) or ((field.source,) if field.source in concrete else None)
+                if sources is None:
+                    columns = None
+                    break
+                columns.update(sources)
+            self._sparse_columns = columns
+        return self._sparse_columns
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if getattr(self, 'action', None) in self.sparse_actions:
+            columns = self.get_sparse_columns()
+            if columns:
+                queryset = queryset.only(*columns)
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['sparse_fields'] = self.get_sparse_fields()
+        return context
+
+    def get_object_cache_variant(self):
+        variant = super().get_object_cache_variant()
+        fields = self.get_sparse_fields()
+        if fields:
+            variant += ':' + hashlib.md5(','.join(fields).encode()).hexdigest()[:12]
+        return variant
+
+
+class ReplicaReadMixin:
+    """
+    Запросы к БД экшенов replica_actions идут на реплику, если клиент
+    не закреплен за primary после своей записи (см. api.db_router)
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def dispatch(self, request, *args, **kwargs):
+        token = read_alias.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            read_alias.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.action in self.replica_actions:
+            read_alias.set(choose_replica(request))
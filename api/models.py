@@ -1,14 +1,209 @@
+import random
 import uuid
+from datetime import timedelta, timezone as dt_timezone
+from itertools import batched
 
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchVector
 from django.core.validators import MinValueValidator
-from django.db import models, transaction
+from django.db import IntegrityError, connections, models, transaction
 from django.contrib.auth.models import User
-from django.db.models import F
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from django.core.cache import cache
 from django.dispatch import receiver
 from django.db.models.signals import post_save
-from .tasks import send_email_task
+from .cache import (
+    COLLECTS_TAG,
+    PAYMENTS_TAG,
+    RANKINGS_TAG,
+    collect_payments_tag,
+    collect_stats_tag,
+    collect_tag,
+    invalidate_on_commit,
+    payment_tag,
+)
+from .images import render_variants, variant_name
+from .live import publish_progress_on_commit
+from .tasks import process_cover_image
+
+
+def user_display_name(user):
+    """ФИО пользователя, а если оно не заполнено - логин"""
+    full_name = f"{user.first_name or ''} {user.last_name or ''}".strip()
+    return full_name if full_name else user.username
+
+
+# Поисковый вектор сбора. Миграция 0009 строит GIN-индекс по этому же
+# выражению, поэтому при изменении выражения индекс нужно пересоздать
+COLLECT_SEARCH_CONFIG = 'russian'
+COLLECT_SEARCH_VECTOR = SearchVector('title', 'description', config=COLLECT_SEARCH_CONFIG)
+
+
+class CollectQuerySet(models.QuerySet):
+
+    def search(self, query):
+        """
+        Полнотекстовый поиск по названию и описанию.
+        В PostgreSQL - websearch-запрос по SearchVector с GIN-индексом,
+        в остальных БД (SQLite) - каждое слово в title или description
+        без морфологии, регистр SQLite игнорирует только для латиницы.
+        """
+        if connections[self.db].vendor == 'postgresql':
+            return self.annotate(search_vector=COLLECT_SEARCH_VECTOR).filter(
+                search_vector=SearchQuery(query, config=COLLECT_SEARCH_CONFIG, search_type='websearch')
+            )
+
+        queryset = self
+        for word in query.split():
+            queryset = queryset.filter(Q(title__icontains=word) | Q(description__icontains=word))
+        return queryset
+
+    def with_counters(self):
+        """
+        Добавляет еще не свернутые в сбор суммы из шардов счетчиков.
+        Одна выборка видит согласованный снимок сбора и его шардов.
+        """
+        shards = CollectCounterShard.objects.filter(collect=OuterRef('pk')).order_by().values('collect')
+        return self.annotate(
+            pending_amount_cents=Coalesce(
+                Subquery(shards.annotate(total=Sum('amount_cents')).values('total')), 0
+            ),
+            pending_contributors=Coalesce(
+                Subquery(shards.annotate(total=Sum('contributors')).values('total')), 0
+            ),
+        )
+
+    def with_actual_totals(self):
+        """
+        Добавляет суммы платежей: LEFT JOIN платежей и GROUP BY по сбору.
+        Все значения читаются одним запросом, то есть из одного снимка БД.
+        """
+        return self.with_counters().annotate(
+            actual_amount=Sum('payments__amount'),
+            actual_contributors=Count('payments__user'),
+        )
+
+    def reconcile_totals(self, collect_ids, dry_run=False):
+        """
+        Сверяет суммы и счетчики донатеров сборов из collect_ids с платежами
+        и исправляет расхождения, если не dry_run.
+        Поправка применяется через F() как разница с прочитанным значением,
+        поэтому не конфликтует с параллельными платежами и сворачиванием шардов.
+        Возвращает {id сбора: (поправка суммы, поправка донатеров)}.
+        """
+        # У архивных сборов платежей в БД нет, суммы сверены при архивации
+        collects = Collect.objects.filter(pk__in=collect_ids, payments_archived_at__isnull=True)
+        rows = collects.with_actual_totals().values(
+            'pk', 'collected_amount_cents', 'contributors_count',
+            'pending_amount_cents', 'pending_contributors',
+            'actual_amount', 'actual_contributors',
+        )
+
+        deltas = {}
+        for row in rows:
+            actual_amount = int((row['actual_amount'] or 0) * 100)
+            actual_contributors = row['actual_contributors'] or 0
+            amount_delta = actual_amount - row['collected_amount_cents'] - row['pending_amount_cents']
+            contributors_delta = (
+                actual_contributors - row['contributors_count'] - row['pending_contributors']
+            )
+            if amount_delta or contributors_delta:
+                deltas[row['pk']] = (amount_delta, contributors_delta)
+
+        if deltas and not dry_run:
+            with transaction.atomic():
+                Collect.objects.bulk_update(
+                    [
+                        Collect(
+                            pk=collect_id,
+                            collected_amount_cents=F('collected_amount_cents') + amount_delta,
+                            contributors_count=F('contributors_count') + contributors_delta,
+                        )
+                        for collect_id, (amount_delta, contributors_delta) in deltas.items()
+                    ],
+                    ['collected_amount_cents', 'contributors_count'],
+                )
+                invalidate_on_commit(*(collect_tag(collect_id) for collect_id in deltas))
+                publish_progress_on_commit(*deltas)
+        return deltas
+
+    def close(self, collect_ids):
+        """
+        Закрывает активные сборы из collect_ids и ставит авторам уведомления.
+        Строки блокируются с SKIP LOCKED, поэтому параллельные воркеры
+        не закроют один сбор дважды. Возвращает количество закрытых.
+        """
+        with transaction.atomic():
+            closed = list(
+                Collect.objects.filter(pk__in=collect_ids, is_active=True)
+                .select_for_update(skip_locked=True)
+                .values_list('pk', flat=True)
+            )
+            if not closed:
+                return 0
+
+            Collect.objects.filter(pk__in=closed).update(is_active=False, updated_at=timezone.now())
+            OutboxEvent.objects.bulk_create([
+                OutboxEvent(event_type=OutboxEvent.EventType.COLLECT_CLOSED, object_id=collect_id)
+                for collect_id in closed
+            ])
+            invalidate_on_commit(COLLECTS_TAG, *(collect_tag(collect_id) for collect_id in closed))
+            publish_progress_on_commit(*closed)
+        return len(closed)
+
+    def delete_batch(self, collect_ids):
+        """
+        Удаляет сборы из collect_ids вместе с платежами, как Collect.delete
+        по каждому, но одним каскадным удалением. Возвращает количество удаленных сборов.
+        """
+        tags = [COLLECTS_TAG, PAYMENTS_TAG]
+        for collect_id in collect_ids:
+            tags += [collect_tag(collect_id), collect_payments_tag(collect_id)]
+        with transaction.atomic():
+            _, deleted = Collect.objects.filter(pk__in=collect_ids).delete()
+            invalidate_on_commit(*tags)
+        return deleted.get(Collect._meta.label, 0)
+
+    def close_expired(self, batch_size=1000):
+        """
+        Закрывает сборы с прошедшим end_datetime пачками.
+        Выборка идет диапазоном по индексу (is_active, end_datetime).
+        """
+        closed = 0
+        while True:
+            collect_ids = list(
+                self.filter(is_active=True, end_datetime__lte=timezone.now())
+                .order_by('end_datetime')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not collect_ids:
+                return closed
+            closed_now = self.close(collect_ids)
+            closed += closed_now
+            if not closed_now:
+                # Вся пачка заблокирована другим воркером
+                return closed
+
+    def close_reached_target(self):
+        """
+        Закрывает сборы, набравшие целевую сумму.
+        Проверяются только сборы с несвернутыми шардами: остальные
+        проверяет rollup после переноса сумм в Collect.
+        """
+        active_shards = CollectCounterShard.objects.exclude(amount_cents=0, contributors=0)
+        collect_ids = list(
+            self.filter(
+                pk__in=active_shards.values('collect_id'),
+                is_active=True,
+                target_amount_cents__isnull=False,
+            )
+            .with_counters()
+            .annotate(total_amount=F('collected_amount_cents') + F('pending_amount_cents'))
+            .filter(total_amount__gte=F('target_amount_cents'))
+            .values_list('pk', flat=True)
+        )
+        return self.close(collect_ids) if collect_ids else 0
 
 
 class Collect(models.Model):
@@ -63,6 +258,19 @@ class Collect(models.Model):
         blank=True,
         verbose_name='Обложка сбора'
     )
+    cover_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные варианты обложки'
+    )
+    payments_archived_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Платежи перенесены в архив',
+        help_text='Суммы сбора сохранены, сами платежи выгружены командой archive_payments'
+    )
     end_datetime = models.DateTimeField(verbose_name='Дата и время завершения сбора')
     created_at = models.DateTimeField(
         auto_now_add=True,
@@ -77,12 +285,15 @@ class Collect(models.Model):
         verbose_name='Активный сбор'
     )
 
+    objects = CollectQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Групповой сбор'
         verbose_name_plural = 'Групповые сборы'
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['author', 'created_at']),
+            models.Index(fields=['created_at', 'id']),
             models.Index(fields=['is_active', 'end_datetime']),
             models.Index(fields=['occasion']),
         ]
@@ -90,10 +301,170 @@ class Collect(models.Model):
     def __str__(self):
         return self.title
 
+    def _load_pending_counters(self):
+        """Суммы шардов, если сбор загружен без with_counters()"""
+        if not hasattr(self, 'pending_amount_cents'):
+            pending = self.counter_shards.aggregate(
+                amount=Coalesce(Sum('amount_cents'), 0),
+                contributors=Coalesce(Sum('contributors'), 0),
+            )
+            self.pending_amount_cents = pending['amount']
+            self.pending_contributors = pending['contributors']
+
+    @property
+    def total_amount_cents(self):
+        """Точная собранная сумма с учетом шардов счетчиков"""
+        self._load_pending_counters()
+        return self.collected_amount_cents + self.pending_amount_cents
+
+    @property
+    def total_contributors(self):
+        """Точное количество донатеров с учетом шардов счетчиков"""
+        self._load_pending_counters()
+        return self.contributors_count + self.pending_contributors
+
+    # Поля, которые пишутся только через update() фоновыми задачами
+    BACKGROUND_FIELDS = ('collected_amount_cents', 'contributors_count', 'cover_variants', 'payments_archived_at')
+
     def save(self, *args, **kwargs):
-        """При сохранении очищаем весь кэш"""
-        cache.clear()
-        super().save(*args, **kwargs)
+        """
+        При сохранении инвалидируем кэш этого сбора и состав списков:
+        изменение полей может добавить сбор в фильтр или поиск.
+        Новая обложка после фиксации отправляется на обработку в Celery.
+
+        Изменение сбора не пишет поля, которые меняют только фоновые задачи
+        (счетчики, варианты обложки, отметку архивации): иначе прочитанные
+        ранее значения затерли бы, например, суммы, перенесенные rollup.
+        """
+        tags = [collect_tag(self.pk), COLLECTS_TAG]
+        cover_uploaded = bool(self.cover_image) and not self.cover_image._committed
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.BACKGROUND_FIELDS
+            ]
+        # В одной транзакции с событием outbox из post_save
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            invalidate_on_commit(*tags)
+            publish_progress_on_commit(self.pk)
+            if cover_uploaded:
+                collect_id, cover_name = str(self.pk), self.cover_image.name
+                transaction.on_commit(lambda: process_cover_image.delay(collect_id, cover_name))
+
+    @property
+    def cover_variant_paths(self):
+        """Варианты текущей обложки или пустой словарь, если они еще не готовы"""
+        if not self.cover_image or self.cover_variants.get('source') != self.cover_image.name:
+            return {}
+        return self.cover_variants['variants']
+
+    def build_cover_variants(self, source_name):
+        """
+        Создает варианты обложки source_name рядом с оригиналом.
+        Если обложку успели заменить, созданные файлы удаляются,
+        иначе удаляются варианты предыдущей обложки.
+        """
+        storage = self.cover_image.storage
+        with storage.open(source_name) as file:
+            rendered = render_variants(file)
+
+        variants = {}
+        for variant, formats in rendered.items():
+            variants[variant] = {'width': formats.pop('width')}
+            for extension, content in formats.items():
+                variants[variant][extension] = storage.save(
+                    variant_name(source_name, variant, extension), content
+                )
+
+        with transaction.atomic():
+            updated = Collect.objects.filter(pk=self.pk, cover_image=source_name).update(
+                cover_variants={'source': source_name, 'variants': variants}
+            )
+            invalidate_on_commit(collect_tag(self.pk))
+
+        stale = self.cover_variants.get('variants', {}) if updated else variants
+        for formats in stale.values():
+            for key, path in formats.items():
+                if key != 'width':
+                    storage.delete(path)
+        return bool(updated)
+
+    def delete(self, *args, **kwargs):
+        """При удалении инвалидируем сбор, списки и каскадно удаленные платежи"""
+        tags = [collect_tag(self.pk), collect_payments_tag(self.pk), COLLECTS_TAG, PAYMENTS_TAG]
+        result = super().delete(*args, **kwargs)
+        invalidate_on_commit(*tags)
+        return result
+
+
+class PaymentQuerySet(models.QuerySet):
+
+    def create_batch(self, payments):
+        """
+        Пакетно создает платежи одним INSERT.
+        Счетчики обновляются одним изменением на каждый затронутый сбор,
+        а события для уведомлений пишутся в outbox одним INSERT.
+        """
+        totals = {}
+        for payment in payments:
+            amount, contributors = totals.get(payment.collect_id, (0, 0))
+            totals[payment.collect_id] = (
+                amount + payment.amount_cents,
+                contributors + (1 if payment.user_id else 0),
+            )
+
+        tags = [PAYMENTS_TAG]
+        for collect_id in totals:
+            tags += [collect_tag(collect_id), collect_payments_tag(collect_id)]
+
+        for payment in payments:
+            payment.fill_donor_display_name()
+
+        with transaction.atomic():
+            created = self.bulk_create(payments)
+            for collect_id, (amount, contributors) in totals.items():
+                CollectCounterShard.objects.add(collect_id, amount_cents=amount, contributors=contributors)
+            OutboxEvent.objects.bulk_create([
+                OutboxEvent(event_type=OutboxEvent.EventType.PAYMENT_CREATED, object_id=payment.pk)
+                for payment in created
+            ])
+            invalidate_on_commit(*tags)
+        return created
+
+    def delete_batch(self, payment_ids):
+        """
+        Удаляет платежи из payment_ids одним DELETE, как Payment.delete по каждому:
+        суммы вычитаются из шардов счетчиков одним изменением на сбор,
+        кэш платежей и их сборов инвалидируется. Возвращает количество удаленных.
+        """
+        with transaction.atomic():
+            payments = list(
+                Payment.objects.filter(pk__in=payment_ids)
+                .select_for_update()
+                .only('pk', 'collect_id', 'amount', 'user_id')
+            )
+            if not payments:
+                return 0
+
+            totals = {}
+            tags = [PAYMENTS_TAG]
+            for payment in payments:
+                amount, contributors = totals.get(payment.collect_id, (0, 0))
+                totals[payment.collect_id] = (
+                    amount + payment.amount_cents,
+                    contributors + (1 if payment.user_id else 0),
+                )
+                tags.append(payment_tag(payment.pk))
+            for collect_id in totals:
+                tags += [collect_tag(collect_id), collect_payments_tag(collect_id)]
+
+            Payment.objects.filter(pk__in=[payment.pk for payment in payments]).delete()
+            for collect_id, (amount, contributors) in totals.items():
+                CollectCounterShard.objects.add(collect_id, amount_cents=-amount, contributors=-contributors)
+            invalidate_on_commit(*tags)
+            publish_progress_on_commit(*totals)
+        return len(payments)
 
 
 class Payment(models.Model):
@@ -145,6 +516,13 @@ class Payment(models.Model):
         default=False,
         verbose_name='Анонимный платеж'
     )
+    donor_display_name = models.CharField(
+        max_length=301,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Имя донатера на момент платежа'
+    )
     created_at = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Дата и время создания'
@@ -154,12 +532,15 @@ class Payment(models.Model):
         verbose_name='Дата и время обновления'
     )
 
+    objects = PaymentQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Платеж'
         verbose_name_plural = 'Платежи'
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['collect', 'created_at']),
+            models.Index(fields=['created_at', 'id']),
             models.Index(fields=['user', 'created_at']),
             models.Index(fields=['payment_method']),
         ]
@@ -169,57 +550,675 @@ class Payment(models.Model):
 
     def save(self, *args, **kwargs):
         """Переопределяем save для автоматического обновления сбора при пополнении"""
+        tags = [collect_tag(self.collect_id), payment_tag(self.pk)]
+        if self._state.adding:
+            tags += [collect_payments_tag(self.collect_id), PAYMENTS_TAG]
+
         with transaction.atomic():
-            cache.clear()
+            adding = self._state.adding
+            if adding:
+                self.fill_donor_display_name()
             super().save(*args, **kwargs)
 
-            # Увеличиваем сумму сбора
-            Collect.objects.filter(id=self.collect_id).update(
-                collected_amount_cents=F('collected_amount_cents') + int(self.amount * 100),
-                updated_at=timezone.now()
+            # Одним UPDATE увеличиваем сумму и счетчик донатеров в случайном шарде
+            if adding:
+                CollectCounterShard.objects.add(
+                    self.collect_id,
+                    amount_cents=self.amount_cents,
+                    contributors=1 if self.user_id else 0,
+                )
+
+            invalidate_on_commit(*tags)
+
+    @property
+    def amount_cents(self):
+        return int(self.amount * 100)
+
+    def public_donor_name(self):
+        """
+        Имя донатера для показа: 'Аноним', 'Гость' или ФИО.
+        Имя берется из снимка в платеже без обращения к пользователю.
+        """
+        if self.is_anonymous:
+            return 'Аноним'
+        if self.donor_display_name:
+            return self.donor_display_name
+        if not self.user_id:
+            return 'Гость'
+        # Платеж без снимка имени (создан в обход Payment.save)
+        return user_display_name(self.user)
+
+    def fill_donor_display_name(self):
+        """Запоминает имя донатера, чтобы чтение платежей не загружало пользователей"""
+        if self.user_id and self.donor_display_name is None:
+            self.donor_display_name = user_display_name(self.user)
+
+    def delete(self, *args, **kwargs):
+        """При удалении вычитаем платеж из счетчиков и инвалидируем кэш"""
+        tags = [
+            collect_tag(self.collect_id),
+            payment_tag(self.pk),
+            collect_payments_tag(self.collect_id),
+            PAYMENTS_TAG,
+        ]
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            CollectCounterShard.objects.add(
+                self.collect_id,
+                amount_cents=-self.amount_cents,
+                contributors=-1 if self.user_id else 0,
             )
+            invalidate_on_commit(*tags)
+            publish_progress_on_commit(self.collect_id)
+        return result
 
-            # Увеличиваем счетчик донатеров (если пользователь есть)
-            if self.user_id:
-                Collect.objects.filter(id=self.collect_id).update(
-                    contributors_count=F('contributors_count') + 1,
-                    updated_at=timezone.now()
+
+class CollectCounterShardQuerySet(models.QuerySet):
+
+    def add(self, collect_id, amount_cents, contributors):
+        """
+        Прибавляет значения к случайному шарду сбора одним UPDATE.
+        Параллельные платежи в один сбор блокируют разные строки, а не строку Collect.
+        """
+        shard = random.randrange(settings.COLLECT_COUNTER_SHARDS)
+        values = {
+            'amount_cents': F('amount_cents') + amount_cents,
+            'contributors': F('contributors') + contributors,
+        }
+        shard_qs = self.filter(collect_id=collect_id, shard=shard)
+        if shard_qs.update(**values):
+            return
+
+        try:
+            with transaction.atomic():
+                self.create(
+                    collect_id=collect_id,
+                    shard=shard,
+                    amount_cents=amount_cents,
+                    contributors=contributors,
                 )
+        except IntegrityError:
+            # Шард успели создать параллельно
+            shard_qs.update(**values)
 
-    def delete(self, *args, **kwargs):
-        """При удалении очищаем весь кэш"""
-        cache.clear()
-        super().delete(*args, **kwargs)
+    def rollup(self, batch_size=500):
+        """
+        Сворачивает накопленные в шардах значения в поля Collect.
+        Сбор увеличивается и шарды уменьшаются на прочитанные значения
+        в одной транзакции, поэтому сумма сбора и шардов не меняется.
+        Возвращает количество обработанных сборов.
+        """
+        processed = 0
+        last_id = None
+        while True:
+            pending = self.exclude(amount_cents=0, contributors=0)
+            if last_id is not None:
+                pending = pending.filter(collect_id__gt=last_id)
+
+            with transaction.atomic():
+                collect_ids = list(
+                    pending
+                    .order_by('collect_id')
+                    .values_list('collect_id', flat=True)
+                    .distinct()[:batch_size]
+                )
+                if not collect_ids:
+                    return processed
+
+                shards = list(
+                    self.filter(collect_id__in=collect_ids)
+                    .exclude(amount_cents=0, contributors=0)
+                    .only('id', 'collect_id', 'amount_cents', 'contributors')
+                )
+                totals = {}
+                for shard in shards:
+                    amount, contributors = totals.get(shard.collect_id, (0, 0))
+                    totals[shard.collect_id] = (amount + shard.amount_cents, contributors + shard.contributors)
+                    shard.amount_cents = F('amount_cents') - shard.amount_cents
+                    shard.contributors = F('contributors') - shard.contributors
+
+                self.bulk_update(shards, ['amount_cents', 'contributors'])
+                Collect.objects.bulk_update(
+                    [
+                        Collect(
+                            pk=collect_id,
+                            collected_amount_cents=F('collected_amount_cents') + amount,
+                            contributors_count=F('contributors_count') + contributors,
+                        )
+                        for collect_id, (amount, contributors) in totals.items()
+                    ],
+                    ['collected_amount_cents', 'contributors_count'],
+                )
+                reached = list(
+                    Collect.objects.filter(
+                        pk__in=collect_ids,
+                        is_active=True,
+                        collected_amount_cents__gte=F('target_amount_cents'),
+                    ).values_list('pk', flat=True)
+                )
+            if reached:
+                Collect.objects.close(reached)
+            processed += len(collect_ids)
+            last_id = collect_ids[-1]
+
+
+class CollectCounterShard(models.Model):
+    """
+    Шард счетчиков сбора.
+    Платежи копят суммы в шардах, а периодическая задача сворачивает их в Collect.
+    """
+    collect = models.ForeignKey(
+        'Collect',
+        on_delete=models.CASCADE,
+        related_name='counter_shards',
+        verbose_name='Сбор'
+    )
+    shard = models.PositiveSmallIntegerField(verbose_name='Номер шарда')
+    amount_cents = models.BigIntegerField(
+        default=0,
+        verbose_name='Несвернутая сумма (в копейках)'
+    )
+    contributors = models.IntegerField(
+        default=0,
+        verbose_name='Несвернутое количество донатеров'
+    )
+
+    objects = CollectCounterShardQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Шард счетчиков сбора'
+        verbose_name_plural = 'Шарды счетчиков сборов'
+        constraints = [
+            models.UniqueConstraint(fields=['collect', 'shard'], name='api_counter_shard_unique'),
+        ]
+        indexes = [
+            # Свернутые шарды остаются нулевыми строками для UPDATE платежей,
+            # а rollup и close_reached_target читают только несвернутые
+            models.Index(
+                fields=['collect'],
+                condition=~Q(amount_cents=0, contributors=0),
+                name='api_counter_shard_pending',
+            ),
+        ]
+
+
+class CollectDailyStatQuerySet(models.QuerySet):
+
+    def add_payments(self, payments):
+        """
+        Добавляет платежи в дневную статистику одним изменением на группу
+        (сбор, день, способ оплаты). Вызывается из обработчика outbox, то есть
+        вне запроса на создание платежа.
+        Строки сборов блокируются, чтобы не пересечься с backfill_collect_stats.
+        FOR NO KEY UPDATE не конфликтует с проверкой внешнего ключа при
+        вставке платежа, поэтому новые платежи в эти сборы не ждут блокировку.
+        """
+        totals = {}
+        for payment in payments:
+            key = (payment.collect_id, timezone.localdate(payment.created_at), payment.payment_method)
+            amount, count, contributors = totals.get(key, (0, 0, 0))
+            totals[key] = (
+                amount + payment.amount_cents,
+                count + 1,
+                contributors + (1 if payment.user_id else 0),
+            )
+        if not totals:
+            return
+
+        collect_ids = sorted({collect_id for collect_id, _, _ in totals})
+        with transaction.atomic():
+            list(
+                Collect.objects.select_for_update(no_key=True)
+                .filter(pk__in=collect_ids).order_by('pk').values_list('pk')
+            )
+            for (collect_id, day, payment_method), (amount, count, contributors) in totals.items():
+                values = {
+                    'amount_cents': F('amount_cents') + amount,
+                    'payments_count': F('payments_count') + count,
+                    'contributors': F('contributors') + contributors,
+                }
+                stat_qs = self.filter(collect_id=collect_id, day=day, payment_method=payment_method)
+                if stat_qs.update(**values):
+                    continue
+                try:
+                    with transaction.atomic():
+                        self.create(
+                            collect_id=collect_id,
+                            day=day,
+                            payment_method=payment_method,
+                            amount_cents=amount,
+                            payments_count=count,
+                            contributors=contributors,
+                        )
+                except IntegrityError:
+                    stat_qs.update(**values)
+            invalidate_on_commit(*(collect_stats_tag(collect_id) for collect_id in collect_ids))
+
+
+class CollectDailyStat(models.Model):
+    """
+    Дневная статистика платежей сбора в разрезе способа оплаты.
+    Чтение статистики - O(количества дней), а не O(количества платежей).
+    """
+    collect = models.ForeignKey(
+        'Collect',
+        on_delete=models.CASCADE,
+        related_name='daily_stats',
+        verbose_name='Сбор'
+    )
+    day = models.DateField(verbose_name='День')
+    payment_method = models.CharField(
+        max_length=50,
+        choices=Payment.PaymentMethod.choices,
+        verbose_name='Способ оплаты'
+    )
+    amount_cents = models.BigIntegerField(
+        default=0,
+        verbose_name='Сумма (в копейках)'
+    )
+    payments_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество платежей'
+    )
+    contributors = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество донатеров'
+    )
+
+    objects = CollectDailyStatQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Дневная статистика сбора'
+        verbose_name_plural = 'Дневная статистика сборов'
+        ordering = ['collect', 'day']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['collect', 'day', 'payment_method'],
+                name='api_collect_daily_stat_unique'
+            ),
+        ]
+
+
+def trend_hour(moment):
+    """Начало часа (UTC), в который попадает момент"""
+    return moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+class CollectHourlyAmountQuerySet(models.QuerySet):
+
+    def add_payments(self, payments):
+        """
+        Добавляет платежи в почасовые суммы сборов одним изменением на
+        (сбор, час). Вызывается обработчиком outbox в одной транзакции
+        с дневной статистикой и под теми же блокировками сборов.
+        """
+        totals = {}
+        for payment in payments:
+            key = (payment.collect_id, trend_hour(payment.created_at))
+            totals[key] = totals.get(key, 0) + payment.amount_cents
+
+        for (collect_id, hour), amount in totals.items():
+            amount_qs = self.filter(collect_id=collect_id, hour=hour)
+            if amount_qs.update(amount_cents=F('amount_cents') + amount):
+                continue
+            try:
+                with transaction.atomic():
+                    self.create(collect_id=collect_id, hour=hour, amount_cents=amount)
+            except IntegrityError:
+                amount_qs.update(amount_cents=F('amount_cents') + amount)
+
+    def window_totals(self, window_start):
+        """
+        Суммы платежей сборов за окно {id сбора: копейки}. Окно начинается
+        с часа window_start, то есть может быть длиннее не больше чем на час.
+        """
+        return dict(
+            self.filter(hour__gte=trend_hour(window_start))
+            .order_by().values('collect_id').annotate(total=Sum('amount_cents'))
+            .values_list('collect_id', 'total')
+        )
+
+    def prune(self, window_start):
+        """Удаляет часы, целиком выпавшие из окна тренда"""
+        return self.filter(hour__lt=trend_hour(window_start)).delete()[0]
+
+
+class CollectHourlyAmount(models.Model):
+    """
+    Сумма платежей сбора за час. Хранится только за окно TRENDING_WINDOW:
+    сумма за окно для ленты trending - не больше суток строк на сбор,
+    а не все платежи окна.
+    """
+    collect = models.ForeignKey(
+        'Collect',
+        on_delete=models.CASCADE,
+        related_name='hourly_amounts',
+        verbose_name='Сбор'
+    )
+    hour = models.DateTimeField(verbose_name='Начало часа')
+    amount_cents = models.BigIntegerField(
+        default=0,
+        verbose_name='Сумма (в копейках)'
+    )
+
+    objects = CollectHourlyAmountQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Почасовая сумма сбора'
+        verbose_name_plural = 'Почасовые суммы сборов'
+        constraints = [
+            models.UniqueConstraint(fields=['collect', 'hour'], name='api_collect_hourly_amount_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['hour'], name='api_collect_hourly_hour'),
+        ]
+
+
+class CollectRankingQuerySet(models.QuerySet):
+
+    def trending(self):
+        """Сборы по сумме платежей за окно TRENDING_WINDOW, по индексу рейтинга"""
+        return self.filter(trending_amount_cents__gt=0).order_by('-trending_amount_cents', 'collect_id')
+
+    def near_goal(self):
+        """Сборы с целью по доле собранной суммы, по индексу рейтинга"""
+        return self.filter(goal_progress__isnull=False).order_by('-goal_progress', 'collect_id')
+
+    def refresh(self, since=None, batch_size=1000):
+        """
+        Пересчитывает рейтинги сборов, которые могли измениться с момента
+        since: платежи за окно тренда, выпавшие из окна, измененные сборы.
+        since=None пересчитывает все активные сборы.
+        В рейтинге хранятся только активные сборы с целью или с платежами
+        за окно. Сумма за окно берется из CollectHourlyAmount, то есть с
+        точностью до часа и без платежей, еще не обработанных outbox.
+        Возвращает количество пересчитанных сборов.
+        """
+        window_start = timezone.now() - timedelta(seconds=settings.TRENDING_WINDOW)
+        # Из почасовых сумм, а не из платежей окна: строк не больше часов окна на сбор
+        CollectHourlyAmount.objects.prune(window_start)
+        velocity = CollectHourlyAmount.objects.window_totals(window_start)
+
+        if since is None:
+            collect_ids = set(Collect.objects.filter(is_active=True).values_list('pk', flat=True))
+            collect_ids |= set(self.values_list('collect_id', flat=True))
+        else:
+            collect_ids = set(velocity)
+            collect_ids |= set(self.filter(trending_amount_cents__gt=0).values_list('collect_id', flat=True))
+            collect_ids |= set(Collect.objects.filter(updated_at__gte=since).values_list('pk', flat=True))
+            if since < window_start:
+                collect_ids |= set(
+                    Payment.objects.filter(created_at__gte=since).values_list('collect_id', flat=True).distinct()
+                )
+
+        for chunk in batched(sorted(collect_ids), batch_size):
+            collects = (
+                Collect.objects.filter(pk__in=chunk)
+                .with_counters()
+                .only('pk', 'occasion', 'is_active', 'target_amount_cents', 'collected_amount_cents')
+            )
+            rankings = []
+            for collect in collects:
+                trending = velocity.get(collect.pk, 0)
+                progress = (
+                    collect.total_amount_cents / collect.target_amount_cents
+                    if collect.target_amount_cents else None
+                )
+                if collect.is_active and (trending or progress is not None):
+                    rankings.append(CollectRanking(
+                        collect_id=collect.pk,
+                        occasion=collect.occasion,
+                        trending_amount_cents=trending,
+                        goal_progress=progress,
+                    ))
+
+            with transaction.atomic():
+                self.filter(collect_id__in=chunk).exclude(
+                    collect_id__in=[ranking.collect_id for ranking in rankings]
+                ).delete()
+                self.bulk_create(
+                    rankings,
+                    update_conflicts=True,
+                    unique_fields=['collect'],
+                    update_fields=['occasion', 'trending_amount_cents', 'goal_progress', 'updated_at'],
+                )
+        invalidate_on_commit(RANKINGS_TAG)
+        return len(collect_ids)
+
+
+class CollectRanking(models.Model):
+    """
+    Рейтинги активного сбора для лент trending и near-goal.
+    Пересчитывается задачей refresh_collect_rankings, поэтому чтение ленты -
+    диапазон по индексу рейтинга, а не сортировка всех сборов по выражению.
+    """
+    collect = models.OneToOneField(
+        'Collect',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ranking',
+        verbose_name='Сбор'
+    )
+    occasion = models.CharField(
+        max_length=50,
+        choices=Collect.Occasion.choices,
+        verbose_name='Повод сбора'
+    )
+    trending_amount_cents = models.BigIntegerField(
+        default=0,
+        verbose_name='Сумма платежей за окно тренда (в копейках)'
+    )
+    goal_progress = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name='Доля собранной суммы от цели'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата пересчета'
+    )
+
+    objects = CollectRankingQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Рейтинг сбора'
+        verbose_name_plural = 'Рейтинги сборов'
+        indexes = [
+            models.Index(fields=['-trending_amount_cents', 'collect'], name='api_ranking_trending'),
+            models.Index(fields=['occasion', '-trending_amount_cents', 'collect'], name='api_ranking_occ_trending'),
+            models.Index(
+                fields=['-goal_progress', 'collect'],
+                condition=Q(goal_progress__isnull=False),
+                name='api_ranking_near_goal',
+            ),
+            models.Index(
+                fields=['occasion', '-goal_progress', 'collect'],
+                condition=Q(goal_progress__isnull=False),
+                name='api_ranking_occ_near_goal',
+            ),
+        ]
+
+
+class OutboxEventQuerySet(models.QuerySet):
+
+    def _load(self, events):
+        """Сборы и платежи пачки событий двумя запросами"""
+        ids = {event_type: [] for event_type in OutboxEvent.EventType.values}
+        for event in events:
+            ids[event.event_type].append(event.object_id)
+
+        collects = Collect.objects.with_counters().select_related('author').in_bulk(
+            ids[OutboxEvent.EventType.COLLECT_CREATED] + ids[OutboxEvent.EventType.COLLECT_CLOSED]
+        )
+        payments = Payment.objects.select_related('collect__author', 'user').in_bulk(
+            ids[OutboxEvent.EventType.PAYMENT_CREATED]
+        )
+        return collects, payments
+
+    def pending(self):
+        """События, по которым еще не обновлена статистика"""
+        return self.filter(processed_at__isnull=True)
+
+    def undelivered(self):
+        """Обработанные события, письма которых еще не отправлены"""
+        return self.filter(processed_at__isnull=False)
+
+    def process(self, events):
+        """
+        Обрабатывает пачку событий: обновляет статистику сборов, после
+        фиксации сообщает подписчикам живого прогресса о сборах с новыми
+        платежами и помечает события обработанными. Письма по ним
+        отправляются отдельно (notifications), поэтому ошибка SMTP не
+        задерживает статистику. Возвращает записи дайджестов авторов.
+        """
+        payments = Payment.objects.select_related('collect__author', 'user').in_bulk(
+            [event.object_id for event in events if event.event_type == OutboxEvent.EventType.PAYMENT_CREATED]
+        )
+        CollectDailyStat.objects.add_payments(payments.values())
+        CollectHourlyAmount.objects.add_payments(payments.values())
+        # Публикация в Redis здесь, а не в запросе платежа
+        publish_progress_on_commit(*{payment.collect_id for payment in payments.values()})
+        self.filter(pk__in=[event.pk for event in events]).update(processed_at=timezone.now())
+
+        digests = []
+        for payment in payments.values():
+            digests += payment_notifications(payment)[1]
+        return digests
+
+    def notifications(self, events):
+        """
+        Письма пачки обработанных событий: [(событие, письма)].
+        Объект мог быть удален до отправки - тогда писем нет.
+        """
+        collects, payments = self._load(events)
+        notifications = []
+        for event in events:
+            messages = []
+            if event.event_type == OutboxEvent.EventType.COLLECT_CREATED:
+                if event.object_id in collects:
+                    messages = collect_notifications(collects[event.object_id])
+            elif event.event_type == OutboxEvent.EventType.COLLECT_CLOSED:
+                if event.object_id in collects:
+                    messages = collect_closed_notifications(collects[event.object_id])
+            elif event.object_id in payments:
+                messages = payment_notifications(payments[event.object_id])[0]
+            notifications.append((event, messages))
+        return notifications
+
+
+class OutboxEvent(models.Model):
+    """
+    Событие transactional outbox.
+    Пишется в одной транзакции с изменением данных, поэтому уведомление
+    уходит только для закоммиченных объектов. Обрабатывается задачей drain_outbox.
+    """
+
+    class EventType(models.TextChoices):
+        COLLECT_CREATED = 'collect_created', 'Сбор создан'
+        COLLECT_CLOSED = 'collect_closed', 'Сбор завершен'
+        PAYMENT_CREATED = 'payment_created', 'Платеж создан'
+
+    event_type = models.CharField(
+        max_length=50,
+        choices=EventType.choices,
+        verbose_name='Тип события'
+    )
+    object_id = models.UUIDField(verbose_name='Идентификатор объекта')
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+    processed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Статистика обновлена',
+        help_text='Событие удаляется после отправки его писем'
+    )
+
+    objects = OutboxEventQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Событие outbox'
+        verbose_name_plural = 'События outbox'
+        ordering = ['id']
+
+
+def collect_notifications(collect):
+    """Письмо автору о созданном сборе"""
+    if not collect.author.email:
+        return []
+    return [{
+        'subject': f'Сбор "{collect.title}" создан',
+        'message': f'Ваш сбор "{collect.title}" успешно создан.',
+        'recipient': collect.author.email,
+    }]
+
+
+def collect_closed_notifications(collect):
+    """Письмо автору о завершенном сборе"""
+    if not collect.author.email:
+        return []
+    return [{
+        'subject': f'Сбор "{collect.title}" завершен',
+        'message': (
+            f'Ваш сбор "{collect.title}" завершен. '
+            f'Собрано {collect.total_amount_cents / 100:.2f} руб. от {collect.total_contributors} донатеров.'
+        ),
+        'recipient': collect.author.email,
+    }]
+
+
+def payment_notifications(payment):
+    """
+    Уведомления о новом платеже: письма и записи дайджестов.
+    При включенном NOTIFICATION_DIGEST_WINDOW автор получает не письмо
+    на каждый платеж, а дайджест сбора за окно.
+    """
+    messages, digests = [], []
+    collect = payment.collect
+
+    # Email донатеру
+    if payment.user and payment.user.email:
+        messages.append({
+            'subject': f'Платёж для сбора "{collect.title}"',
+            'message': f'Ваш платёж {payment.amount} руб. создан.',
+            'recipient': payment.user.email,
+        })
+
+    # Email автору сбора
+    if collect.author.email and payment.user_id != collect.author_id:
+        if settings.NOTIFICATION_DIGEST_WINDOW:
+            digests.append({
+                'collect_id': str(collect.pk),
+                'collect_title': collect.title,
+                'recipient': collect.author.email,
+                'amount_cents': payment.amount_cents,
+            })
+        else:
+            donor_name = payment.user.username if payment.user else 'Аноним'
+            messages.append({
+                'subject': f'Новый платёж для сбора "{collect.title}"',
+                'message': f'{donor_name} перевел {payment.amount} руб.',
+                'recipient': collect.author.email,
+            })
+    return messages, digests
 
 
 @receiver(post_save, sender='api.Collect')
 def send_collect_email(sender, instance, created, **kwargs):
-    """Отправка email при создании сбора"""
-    if created and instance.author.email:
-        send_email_task.delay(
-            subject=f'Сбор "{instance.title}" создан',
-            message=f'Ваш сбор "{instance.title}" успешно создан.',
-            recipient=instance.author.email
+    """Событие outbox для email при создании сбора"""
+    if created:
+        OutboxEvent.objects.create(
+            event_type=OutboxEvent.EventType.COLLECT_CREATED,
+            object_id=instance.pk,
         )
 
 
 @receiver(post_save, sender='api.Payment')
 def send_payment_email(sender, instance, created, **kwargs):
-    """Отправка email при создании платежа"""
+    """Событие outbox для email при создании платежа"""
     if created:
-        # Email донатеру
-        if instance.user and instance.user.email:
-            send_email_task.delay(
-                subject=f'Платёж для сбора "{instance.collect.title}"',
-                message=f'Ваш платёж {instance.amount} руб. создан.',
-                recipient=instance.user.email
-            )
-
-        # Email автору сбора
-        if instance.collect.author.email and instance.user != instance.collect.author:
-            donor_name = instance.user.username if instance.user else 'Аноним'
-            send_email_task.delay(
-                subject=f'Новый платёж для сбора "{instance.collect.title}"',
-                message=f'{donor_name} перевел {instance.amount} руб.',
-                recipient=instance.collect.author.email
-            )
+        OutboxEvent.objects.create(
+            event_type=OutboxEvent.EventType.PAYMENT_CREATED,
+            object_id=instance.pk,
+        )
@@ -0,0 +1,140 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, Cursor, CursorPagination, PageNumberPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Курсорная пагинация по (-created_at, -id).
+
+    Позиция курсора содержит и created_at, и id, поэтому страница выбирается
+    одним поиском по индексу без COUNT(*) и OFFSET, даже если у записей
+    совпадает время создания.
+    """
+    ordering = ('-created_at', '-id')
+
+    def _get_value(self, item, field_name):
+        return item[field_name] if isinstance(item, dict) else getattr(item, field_name)
+
+    def encode_position(self, item):
+        created_at = self._get_value(item, 'created_at')
+        return f"{created_at.isoformat()}|{self._get_value(item, 'id')}"
+
+    def decode_position(self, position, queryset):
+        try:
+            created_at, pk = position.split('|', 1)
+            created_at = parse_datetime(created_at)
+            pk = queryset.model._meta.pk.to_python(pk)
+        except (AttributeError, ValueError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+        position = None
+        if self.cursor and self.cursor.position is not None:
+            position = self.decode_position(self.cursor.position, queryset)
+
+        if reverse:
+            queryset = queryset.order_by('created_at', 'id')
+        else:
+            queryset = queryset.order_by('-created_at', '-id')
+
+        if position is not None:
+            created_at, pk = position
+            lookup = 'gt' if reverse else 'lt'
+            queryset = queryset.filter(
+                Q(**{f'created_at__{lookup}': created_at})
+                | Q(created_at=created_at, **{f'id__{lookup}': pk})
+            )
+
+        # Одна лишняя запись показывает, есть ли следующая страница
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        cursor = Cursor(offset=0, reverse=False, position=self.encode_position(self.page[-1]))
+        return self.encode_cursor(cursor)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        cursor = Cursor(offset=0, reverse=True, position=self.encode_position(self.page[0]))
+        return self.encode_cursor(cursor)
+
+
+class FeedPagination(BasePagination):
+    """
+    Пагинация лент сборов и платежей.
+    По умолчанию постраничная (?page=) для существующих клиентов,
+    курсорная при ?pagination=cursor или переданном ?cursor=.
+    """
+    cursor_mode_query_param = 'pagination'
+
+    def __init__(self):
+        self.page_number = PageNumberPagination()
+        self.keyset = KeysetPagination()
+        self.delegate = self.page_number
+
+    def use_cursor(self, request):
+        params = request.query_params
+        return (
+            self.keyset.cursor_query_param in params
+            or params.get(self.cursor_mode_query_param) == 'cursor'
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.delegate = self.keyset if self.use_cursor(request) else self.page_number
+        return self.delegate.paginate_queryset(queryset, request, view)
+
+    @property
+    def display_page_controls(self):
+        return self.delegate.display_page_controls
+
+    def get_paginated_response(self, data):
+        return self.delegate.get_paginated_response(data)
+
+    def to_html(self):
+        return self.delegate.to_html()
+
+    def get_results(self, data):
+        return self.delegate.get_results(data)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            *self.page_number.get_schema_operation_parameters(view),
+            {
+                'name': self.cursor_mode_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Режим пагинации: cursor - курсорная, без подсчета количества',
+                'schema': {'type': 'string', 'enum': ['page', 'cursor']},
+            },
+            *self.keyset.get_schema_operation_parameters(view),
+        ]
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = self.page_number.get_paginated_response_schema(schema)
+        response_schema['required'] = ['results']
+        return response_schema
@@ -0,0 +1,200 @@
+# api/partitioning.py
+"""
+Помесячное секционирование таблицы платежей в PostgreSQL.
+
+Секционированная api_payment имеет первичный ключ (id, created_at): ключ
+секционирования обязан входить в уникальные ограничения. ORM по-прежнему
+работает с моделью Payment по id. Строки вне созданных секций попадают
+в секцию по умолчанию api_payment_default.
+"""
+from datetime import date
+
+from django.utils import timezone
+
+PAYMENT_TABLE = 'api_payment'
+DEFAULT_PARTITION = f'{PAYMENT_TABLE}_default'
+
+
+def month_start(day, shift=0):
+    """Первое число месяца day, сдвинутого на shift месяцев"""
+    month = day.year * 12 + day.month - 1 + shift
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{PAYMENT_TABLE}_p{month:%Y_%m}'
+
+
+def is_partitioned(connection):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relkind = %s FROM pg_class WHERE oid = %s::regclass', ['p', PAYMENT_TABLE])
+        row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def payment_partitions(connection):
+    """Секции платежей: [(имя, начало месяца или None для секции по умолчанию)]"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+            ORDER BY c.relname
+            """,
+            [PAYMENT_TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    prefix = f'{PAYMENT_TABLE}_p'
+    return [
+        (name, date(int(name[len(prefix):][:4]), int(name[-2:]), 1) if name.startswith(prefix) else None)
+        for name in names
+    ]
+
+
+def _copy_table_definition(cursor, source, target, partitioned):
+    """
+    Создает target по структуре source: колонки, NOT NULL, внешние ключи
+    и индексы с теми же именами, чтобы последующие миграции Django их находили.
+    Индексы source переименовываются с суффиксом _old.
+    """
+    suffix = ' PARTITION BY RANGE (created_at)' if partitioned else ''
+    cursor.execute(f'CREATE TABLE {target} (LIKE {source} INCLUDING DEFAULTS){suffix}')
+    primary_key = '(id, created_at)' if partitioned else '(id)'
+    cursor.execute(f'ALTER TABLE {target} ADD CONSTRAINT {target}_pkey PRIMARY KEY {primary_key}')
+
+    cursor.execute(
+        """
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f'
+        """,
+        [source],
+    )
+    for name, definition in cursor.fetchall():
+        cursor.execute(f'ALTER TABLE {source} DROP CONSTRAINT {name}')
+        cursor.execute(f'ALTER TABLE {target} ADD CONSTRAINT {name} {definition}')
+
+    cursor.execute(
+        """
+        SELECT i.relname, pg_get_indexdef(i.oid)
+        FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = %s::regclass AND NOT x.indisprimary
+        """,
+        [source],
+    )
+    for name, definition in cursor.fetchall():
+        cursor.execute(f'ALTER INDEX {name} RENAME TO {name[:59]}_old')
+        columns = definition[definition.index(' USING '):]
+        cursor.execute(f'CREATE INDEX {name} ON {target}{columns}')
+
+
+def create_partition(connection, month):
+    """
+    Создает секцию месяца, если ее нет. Строки этого месяца, уже попавшие
+    в секцию по умолчанию, переносятся в новую секцию.
+    Возвращает True, если секция создана.
+    """
+    name = partition_name(month)
+    start, end = month, month_start(month, 1)
+    bounds = f"FROM ('{start:%Y-%m-%d} 00:00:00+00') TO ('{end:%Y-%m-%d} 00:00:00+00')"
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [name])
+        if cursor.fetchone()[0]:
+            return False
+
+        cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [DEFAULT_PARTITION])
+        has_default = cursor.fetchone()[0]
+        in_range = "created_at >= %s AND created_at < %s"
+        if has_default:
+            cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range})', [start, end])
+        if has_default and cursor.fetchone()[0]:
+            # Секцию нельзя создать, пока подходящие строки лежат в секции по умолчанию
+            cursor.execute(f'CREATE TABLE {name} (LIKE {PAYMENT_TABLE} INCLUDING DEFAULTS)')
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {in_range} RETURNING *) '
+                f'INSERT INTO {name} SELECT * FROM moved',
+                [start, end],
+            )
+            cursor.execute(f'ALTER TABLE {PAYMENT_TABLE} ATTACH PARTITION {name} FOR VALUES {bounds}')
+        else:
+            cursor.execute(f'CREATE TABLE {name} PARTITION OF {PAYMENT_TABLE} FOR VALUES {bounds}')
+    return True
+
+
+def ensure_partitions(connection, months_ahead):
+    """Секции с текущего месяца на months_ahead месяцев вперед, возвращает созданные"""
+    if not is_partitioned(connection):
+        return []
+    current = month_start(timezone.now())
+    months = [month_start(current, shift) for shift in range(months_ahead + 1)]
+    return [partition_name(month) for month in months if create_partition(connection, month)]
+
+
+def partition_payments(connection, months_ahead):
+    """
+    Переводит api_payment на помесячные секции: создает секционированную
+    таблицу, секции для месяцев с платежами и вперед, копирует строки.
+    Таблица блокируется на время копирования, поэтому на большой базе
+    запускать в окно обслуживания. Ничего не делает, если таблица уже секционирована.
+    """
+    if connection.vendor != 'postgresql' or is_partitioned(connection):
+        return False
+    legacy = f'{PAYMENT_TABLE}_unpartitioned'
+    with connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {PAYMENT_TABLE} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'ALTER TABLE {PAYMENT_TABLE} RENAME TO {legacy}')
+        cursor.execute(f'ALTER INDEX {PAYMENT_TABLE}_pkey RENAME TO {legacy}_pkey')
+        _copy_table_definition(cursor, legacy, PAYMENT_TABLE, partitioned=True)
+        cursor.execute(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PAYMENT_TABLE} DEFAULT')
+
+        cursor.execute(f'SELECT MIN(created_at) FROM {legacy}')
+        first = cursor.fetchone()[0]
+        current = month_start(timezone.now())
+        month = month_start(first) if first else current
+        while month <= month_start(current, months_ahead):
+            create_partition(connection, month)
+            month = month_start(month, 1)
+
+        cursor.execute(f'INSERT INTO {PAYMENT_TABLE} SELECT * FROM {legacy}')
+        cursor.execute(f'DROP TABLE {legacy}')
+        cursor.execute(f'ANALYZE {PAYMENT_TABLE}')
+    return True
+
+
+def unpartition_payments(connection):
+    """Обратный перевод api_payment в обычную таблицу"""
+    if not is_partitioned(connection):
+        return False
+    source = f'{PAYMENT_TABLE}_partitioned'
+    with connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {PAYMENT_TABLE} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'ALTER TABLE {PAYMENT_TABLE} RENAME TO {source}')
+        cursor.execute(f'ALTER INDEX {PAYMENT_TABLE}_pkey RENAME TO {source}_pkey')
+        _copy_table_definition(cursor, source, PAYMENT_TABLE, partitioned=False)
+        cursor.execute(f'INSERT INTO {PAYMENT_TABLE} SELECT * FROM {source}')
+        cursor.execute(f'DROP TABLE {source} CASCADE')
+    return True
+
+
+def drop_empty_partitions(connection, before):
+    """
+    Удаляет пустые секции месяцев, закончившихся до before: после архивации
+    платежей старые месяцы не занимают место и не участвуют в планах запросов.
+    Возвращает имена удаленных секций.
+    """
+    if not is_partitioned(connection):
+        return []
+    dropped = []
+    with connection.cursor() as cursor:
+        for name, month in payment_partitions(connection):
+            if month is None or month_start(month, 1) > before:
+                continue
+            cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {name})')
+            if cursor.fetchone()[0]:
+                continue
+            cursor.execute(f'ALTER TABLE {PAYMENT_TABLE} DETACH PARTITION {name}')
+            cursor.execute(f'DROP TABLE {name}')
+            dropped.append(name)
+    return dropped
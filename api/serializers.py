@@ -1,34 +1,195 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
+from .images import validate_cover_dimensions
+from .metrics import serializer_timer
 from .models import Collect, Payment
 
 
-class CollectSimpleSerializer(serializers.ModelSerializer):
+class TimedSerializerMixin:
+    """Учитывает время валидации и сериализации в метриках запроса"""
+
+    def is_valid(self, *, raise_exception=False):
+        with serializer_timer():
+            return super().is_valid(raise_exception=raise_exception)
+
+    @property
+    def data(self):
+        with serializer_timer():
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
+
+
+class SparseFieldsetSerializerMixin:
+    """Оставляет только поля из context['sparse_fields'], если они заданы"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        sparse_fields = self.context.get('sparse_fields')
+        if sparse_fields is not None:
+            for name in set(self.fields) - set(sparse_fields):
+                self.fields.pop(name)
+
+
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Берет связанный объект из загруженных пакетом заранее,
+    чтобы пакетная валидация не делала запрос на каждый элемент
+    """
+
+    def to_internal_value(self, data):
+        prefetched = self.context.get('prefetched', {}).get(self.field_name)
+        if prefetched is None:
+            return super().to_internal_value(data)
+
+        try:
+            pk = self.get_queryset().model._meta.pk.to_python(data)
+        except (DjangoValidationError, TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in prefetched:
+            self.fail('does_not_exist', pk_value=data)
+        return prefetched[pk]
+
+
+class CollectSimpleSerializer(TimedSerializerMixin, SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для Collect"""
+    collected_amount_cents = serializers.IntegerField(source='total_amount_cents', read_only=True)
+    contributors_count = serializers.IntegerField(source='total_contributors', read_only=True)
+    cover_variants = serializers.SerializerMethodField()
+    cover_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Collect
         fields = '__all__'
+        list_serializer_class = TimedListSerializer
+        # Колонки модели для полей, которые не совпадают с полем модели
+        field_columns = {
+            'collected_amount_cents': ('collected_amount_cents',),
+            'contributors_count': ('contributors_count',),
+            'cover_variants': ('cover_image', 'cover_variants'),
+            'cover_srcset': ('cover_image', 'cover_variants'),
+        }
+
+    def _cover_url(self, path):
+        url = Collect.cover_image.field.storage.url(path)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def get_cover_variants(self, obj) -> dict:
+        """
+        Уменьшенные копии обложки: {вариант: {'width', 'webp', 'jpeg'}}.
+        Пусто, пока обложка не обработана.
+        """
+        return {
+            variant: {
+                key: value if key == 'width' else self._cover_url(value)
+                for key, value in formats.items()
+            }
+            for variant, formats in obj.cover_variant_paths.items()
+        }
 
+    def get_cover_srcset(self, obj) -> dict:
+        """Готовые значения srcset по форматам: {'webp': 'url 320w, url 960w', ...}"""
+        srcset = {}
+        for formats in obj.cover_variant_paths.values():
+            for key, path in formats.items():
+                if key != 'width':
+                    srcset.setdefault(key, []).append(f"{self._cover_url(path)} {formats['width']}w")
+        return {key: ', '.join(candidates) for key, candidates in srcset.items()}
 
-class PaymentSimpleSerializer(serializers.ModelSerializer):
+    def validate_cover_image(self, value):
+        image = getattr(value, 'image', None)
+        if image is not None:
+            error = validate_cover_dimensions(value)
+            if error:
+                raise serializers.ValidationError(error)
+        return value
+
+
+class CollectListSerializer(CollectSimpleSerializer):
+    """Компактное представление сбора для списка: без описания и служебных дат"""
+
+    class Meta(CollectSimpleSerializer.Meta):
+        fields = [
+            'id',
+            'author',
+            'title',
+            'occasion',
+            'target_amount_cents',
+            'collected_amount_cents',
+            'contributors_count',
+            'cover_image',
+            'cover_variants',
+            'cover_srcset',
+            'end_datetime',
+            'created_at',
+            'is_active',
+        ]
+
+
+class PaymentListSerializer(TimedListSerializer):
+    """
+    Пакетная валидация и создание платежей.
+    Невалидные элементы попадают в item_errors и не отменяют остальные.
+    """
+
+    def _prefetch(self, data):
+        """Загружает сборы и пользователей всего пакета двумя запросами"""
+        lookups = {
+            'collect': Collect.objects.select_related('author'),
+            'user': User.objects.all(),
+        }
+        prefetched = {}
+        for field_name, queryset in lookups.items():
+            pk_field = queryset.model._meta.pk
+            pks = set()
+            for item in data:
+                if isinstance(item, dict) and item.get(field_name) not in (None, ''):
+                    try:
+                        pks.add(pk_field.to_python(item[field_name]))
+                    except (DjangoValidationError, TypeError, ValueError):
+                        continue
+            prefetched[field_name] = queryset.in_bulk(pks)
+        return prefetched
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            raise serializers.ValidationError({'non_field_errors': ['Ожидается список платежей']})
+        if not data:
+            raise serializers.ValidationError({'non_field_errors': ['Список платежей пуст']})
+        if len(data) > settings.PAYMENT_BATCH_MAX_SIZE:
+            raise serializers.ValidationError({
+                'non_field_errors': [f'Не более {settings.PAYMENT_BATCH_MAX_SIZE} платежей за запрос']
+            })
+
+        self.context['prefetched'] = self._prefetch(data)
+        self.item_errors = {}
+        validated = []
+        for index, item in enumerate(data):
+            try:
+                validated.append(self.child.run_validation(item))
+            except serializers.ValidationError as exc:
+                self.item_errors[index] = exc.detail
+        return validated
+
+    def create(self, validated_data):
+        return Payment.objects.create_batch([Payment(**attrs) for attrs in validated_data])
+
+
+class PaymentSimpleSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для Payment"""
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
     user_full_name = serializers.SerializerMethodField()
 
     class Meta:
         model = Payment
-        fields = '__all__'
-
-    def get_user_full_name(self, obj):
-        """
-        Возвращает ФИО пользователя или 'Аноним'
-        """
-        if obj.is_anonymous:
-            return "Аноним"
-
-        if not obj.user:
-            return "Гость"
+        exclude = ['donor_display_name']
+        list_serializer_class = PaymentListSerializer
 
-        first_name = obj.user.first_name or ''
-        last_name = obj.user.last_name or ''
-        full_name = f"{first_name} {last_name}".strip()
-        return full_name if full_name else obj.user.username
+    def get_user_full_name(self, obj) -> str:
+        """Возвращает ФИО пользователя, 'Аноним' или 'Гость'"""
+        return obj.public_donor_name()
@@ -1,27 +1,243 @@
 # api/tasks.py
 import logging
-from django.core.mail import send_mail
+import smtplib
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.db import connection, transaction
+from django.utils import timezone
 from collect_service.celery import app
+from .cache import incr_counter
+from .partitioning import ensure_partitions
 
 log = logging.getLogger(__name__)
 
+RANKINGS_REFRESHED_KEY = 'rankings:refreshed_at'
+# Сколько помнить письма событий outbox, уже отправленные до отката пачки
+OUTBOX_SENT_TIMEOUT = 60 * 60 * 24
 
-@app.task
-def send_email_task(subject, message, recipient):
-    """Задача отправки email"""
-    log.info(
-        f"Уведомление по электронной почте пользователю c email:{recipient}"
+
+def _email_message(message, connection):
+    return EmailMessage(
+        subject=message['subject'],
+        body=message['message'],
+        from_email='noreply@moneycollect.com',
+        to=[message['recipient']],
+        connection=connection,
     )
+
+
+def _outbox_sent_key(event_id, index):
+    return f'outbox:sent:{event_id}:{index}'
+
+
+def _is_permanent_failure(exc):
+    """Ошибка SMTP, которую повторная отправка не исправит (ответ 5xx)"""
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in exc.recipients.values())
+    return isinstance(exc, smtplib.SMTPResponseException) and exc.smtp_code >= 500
+
+
+def send_event_messages(connection, event_id, messages):
+    """
+    Отправляет письма события outbox по открытому SMTP-соединению.
+    Каждое доставленное письмо сразу отмечается в кэше, поэтому после
+    ошибки повторная отправка события его пропустит. Письмо, отклоненное
+    сервером окончательно (неверный адрес), пишется в лог и тоже
+    отмечается, иначе оно блокировало бы удаление события навсегда.
+    """
+    for index, message in enumerate(messages):
+        key = _outbox_sent_key(event_id, index)
+        if cache.get(key):
+            continue
+        # Соединение открывается при первом письме и остается открытым до close()
+        connection.open()
+        try:
+            connection.send_messages([_email_message(message, connection)])
+        except smtplib.SMTPException as exc:
+            if not _is_permanent_failure(exc):
+                raise
+            log.error(f"Письмо события outbox {event_id} на {message['recipient']} отклонено: {exc}")
+        cache.set(key, 1, timeout=OUTBOX_SENT_TIMEOUT)
+
+
+def _digest_key(collect_id, name):
+    return f'digest:{collect_id}:{name}'
+
+
+def add_to_digest(collect_id, collect_title, recipient, amount_cents):
+    """
+    Добавляет платеж в дайджест сбора.
+    Первый платеж окна планирует отправку дайджеста через NOTIFICATION_DIGEST_WINDOW секунд.
+    """
+    incr_counter(_digest_key(collect_id, 'count'))
+    incr_counter(_digest_key(collect_id, 'amount'), amount_cents)
+
+    window = settings.NOTIFICATION_DIGEST_WINDOW
+    if cache.add(_digest_key(collect_id, 'scheduled'), 1, timeout=window):
+        send_digest_task.apply_async((collect_id, collect_title, recipient), countdown=window)
+
+
+@app.task
+def send_digest_task(collect_id, collect_title, recipient):
+    """Отправка автору дайджеста платежей сбора за окно"""
+    count_key, amount_key = _digest_key(collect_id, 'count'), _digest_key(collect_id, 'amount')
+    counters = cache.get_many([count_key, amount_key])
+    count, amount_cents = counters.get(count_key, 0), counters.get(amount_key, 0)
+    if not count:
+        return
+
+    # Вычитаем прочитанное, а не обнуляем: платежи, пришедшие во время отправки,
+    # попадут в следующий дайджест
+    cache.decr(count_key, count)
+    cache.decr(amount_key, amount_cents)
+
+    minutes = max(settings.NOTIFICATION_DIGEST_WINDOW // 60, 1)
     send_mail(
-        subject=subject,
-        message=message,
+        subject=f'Новые платежи для сбора "{collect_title}"',
+        message=(
+            f'{count} новых платежей в сбор "{collect_title}" за последние {minutes} мин. '
+            f'на сумму {amount_cents / 100:.2f} руб.'
+        ),
         from_email='noreply@moneycollect.com',
         recipient_list=[recipient],
         fail_silently=True,
     )
+    log.info(f"Дайджест сбора {collect_id} отправлен на email {recipient}")
+
+
+@app.task
+def rollup_collect_counters():
+    """Периодическое сворачивание шардов счетчиков в суммы сборов"""
+    from .models import CollectCounterShard
+
+    processed = CollectCounterShard.objects.rollup()
+    log.info(f"Свернуты счетчики {processed} сборов")
+    return processed
 
-    log.info(f"Отправка на email {recipient}")
 
-    log.info(
-        f"Отправка на email {recipient} завершена!",
+@app.task
+def close_finished_collects():
+    """Периодическое закрытие истекших сборов и сборов, набравших цель"""
+    from .models import Collect
+
+    expired = Collect.objects.close_expired()
+    reached = Collect.objects.close_reached_target()
+    if expired or reached:
+        log.info(f"Закрыто сборов: по сроку {expired}, по цели {reached}")
+    return expired + reached
+
+
+@app.task
+def drain_outbox():
+    """
+    Обработка событий outbox пачками в два шага.
+    SELECT ... FOR UPDATE SKIP LOCKED не дает двум воркерам взять одно событие.
+
+    Сначала короткие транзакции обновляют статистику сборов, публикуют
+    живой прогресс и пополняют дайджесты (после фиксации) и помечают
+    события обработанными - без обращений к SMTP. Затем письма
+    обработанных событий уходят по одному соединению, и событие удаляется
+    после отправки всех своих писем. Доставленные письма отмечаются по
+    одному, поэтому после временной ошибки SMTP повторная отправка их
+    пропустит, а статистика тем временем продолжает обновляться.
+    """
+    from .models import OutboxEvent
+
+    processed = 0
+    for _ in range(settings.OUTBOX_MAX_BATCHES):
+        with transaction.atomic():
+            events = list(
+                OutboxEvent.objects.pending().select_for_update(skip_locked=True)[:settings.OUTBOX_BATCH_SIZE]
+            )
+            if not events:
+                break
+            for digest in OutboxEvent.objects.process(events):
+                transaction.on_commit(partial(add_to_digest, **digest))
+        processed += len(events)
+
+    if processed:
+        log.info(f"Обработано событий outbox: {processed}")
+    deliver_outbox()
+    return processed
+
+
+def deliver_outbox():
+    """
+    Отправка писем обработанных событий outbox и их удаление.
+    Транзакция держит блокировку только строк событий, чтобы два воркера
+    не отправляли одно событие; статистику и сборы она не блокирует.
+    """
+    from .models import OutboxEvent
+
+    delivered = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        for _ in range(settings.OUTBOX_MAX_BATCHES):
+            with transaction.atomic():
+                events = list(
+                    OutboxEvent.objects.undelivered().select_for_update(skip_locked=True)[:settings.OUTBOX_BATCH_SIZE]
+                )
+                if not events:
+                    break
+                for event, messages in OutboxEvent.objects.notifications(events):
+                    send_event_messages(connection, event.pk, messages)
+                OutboxEvent.objects.filter(pk__in=[event.pk for event in events]).delete()
+            delivered += len(events)
+    finally:
+        connection.close()
+
+    if delivered:
+        log.info(f"Отправлены письма событий outbox: {delivered}")
+    return delivered
+
+
+@app.task
+def refresh_collect_rankings():
+    """
+    Инкрементальный пересчет рейтингов сборов, изменившихся с прошлого запуска.
+    Без отметки о прошлом запуске (первый запуск, очищенный кэш) рейтинги
+    пересчитываются целиком.
+    """
+    from .models import CollectRanking
+
+    started = timezone.now()
+    since = cache.get(RANKINGS_REFRESHED_KEY)
+    refreshed = CollectRanking.objects.refresh(since)
+    # Перекрытие с прошлым запуском: транзакции, закоммиченные после начала
+    # запуска, могли записать updated_at раньше него
+    cache.set(
+        RANKINGS_REFRESHED_KEY,
+        started - timedelta(seconds=settings.RANKINGS_REFRESH_INTERVAL),
+        timeout=None,
     )
+    log.info(f"Пересчитаны рейтинги {refreshed} сборов")
+    return refreshed
+
+
+@app.task
+def create_payment_partitions():
+    """Создание секций платежей на PAYMENT_PARTITIONS_AHEAD месяцев вперед"""
+    with transaction.atomic():
+        created = ensure_partitions(connection, settings.PAYMENT_PARTITIONS_AHEAD)
+    if created:
+        log.info(f"Созданы секции платежей: {', '.join(created)}")
+    return created
+
+
+@app.task
+def process_cover_image(collect_id, source_name):
+    """Генерация уменьшенных вариантов обложки сбора"""
+    from .models import Collect
+
+    collect = Collect.objects.filter(pk=collect_id).first()
+    # Сбор удален или обложку уже заменили: ее обработает своя задача
+    if collect is None or collect.cover_image.name != source_name:
+        return False
+    built = collect.build_cover_variants(source_name)
+    if built:
+        log.info(f"Созданы варианты обложки сбора {collect_id}")
+    return built
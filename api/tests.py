@@ -0,0 +1,226 @@
+import smtplib
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.pagination import PageNumberPagination
+
+from .db_router import PIN_COOKIE
+from .models import Collect, CollectDailyStat, CollectHourlyAmount, CollectRanking, OutboxEvent, Payment
+from .tasks import drain_outbox
+from .pagination import KeysetPagination
+
+
+def create_collect(author, **kwargs):
+    return Collect.objects.create(
+        author=author,
+        title=kwargs.pop('title', 'Сбор'),
+        occasion=Collect.Occasion.BIRTHDAY,
+        description='Описание',
+        end_datetime=timezone.now() + timedelta(days=30),
+        **kwargs,
+    )
+
+
+def override_page_size(page_size):
+    """PAGE_SIZE читается классами пагинации при импорте, поэтому подменяется атрибут"""
+    patches = [mock.patch.object(cls, 'page_size', page_size) for cls in (PageNumberPagination, KeysetPagination)]
+    stack = ExitStack()
+    for patch in patches:
+        stack.enter_context(patch)
+    return stack
+
+
+class PaymentListQueriesTest(TestCase):
+    """Число запросов списка платежей не зависит от размера страницы"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', first_name='Анна', last_name='Автор')
+        collect = create_collect(author)
+        donors = [
+            User.objects.create_user(f'donor{index}', first_name='Донатер', last_name=str(index))
+            for index in range(10)
+        ]
+        for index in range(60):
+            Payment.objects.create(
+                user=donors[index % len(donors)] if index % 3 else None,
+                collect=collect,
+                amount=Decimal('100.00'),
+                payment_method=Payment.PaymentMethod.CARD,
+                is_anonymous=index % 5 == 0,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_page_number_queries(self):
+        # COUNT(*), id страницы и один запрос недостающих в кэше платежей
+        for page_size in (5, 50):
+            with self.subTest(page_size=page_size), override_page_size(page_size):
+                cache.clear()
+                with self.assertNumQueries(3):
+                    response = self.client.get('/payments/')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), page_size)
+                self.assertEqual(response.data['count'], 60)
+
+    def test_cursor_queries(self):
+        # Без COUNT(*): id страницы и недостающие платежи
+        for page_size in (5, 50):
+            with self.subTest(page_size=page_size), override_page_size(page_size):
+                cache.clear()
+                with self.assertNumQueries(2):
+                    response = self.client.get('/payments/', {'pagination': 'cursor'})
+                self.assertEqual(len(response.data['results']), page_size)
+
+    def test_cached_page_without_queries(self):
+        self.client.get('/payments/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/payments/')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(REPLICA_DATABASES=['replica_1'], REPLICA_LAG_WINDOW=60)
+class ReplicaRoutingTest(TransactionTestCase):
+    """
+    replica_1 в settings_test - отдельное соединение к той же базе, поэтому
+    по запросам соединений видно, куда роутер отправил чтение
+    """
+    databases = {'default', 'replica_1'}
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user('author', first_name='Анна', last_name='Автор')
+        self.collect = create_collect(author, target_amount_cents=100000)
+        self.url = f'/collects/{self.collect.pk}/'
+
+    def get(self, url):
+        """Ответ и число запросов к primary и к реплике"""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica_1']) as replica:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(primary), len(replica)
+
+    def test_reads_go_to_replica(self):
+        _, primary, replica = self.get(self.url)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_client_reads_own_payment_from_primary(self):
+        self.get(self.url)
+        response = self.client.post('/payments/', {
+            'collect': self.collect.pk,
+            'amount': '150.00',
+            'payment_method': Payment.PaymentMethod.CARD,
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        response, primary, replica = self.get(self.url)
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+        self.assertEqual(response.data['collected_amount_cents'], 15000)
+
+    def test_pinned_client_skips_cache(self):
+        # Запись кэша посчитана на реплике и могла отстать от записи клиента
+        self.get(self.url)
+        self.get('/payments/')
+        self.client.cookies[PIN_COOKIE] = str(time.time() + 60)
+
+        for url in (self.url, '/payments/'):
+            with self.subTest(url=url):
+                _, primary, replica = self.get(url)
+                self.assertEqual(replica, 0)
+                self.assertGreater(primary, 0)
+
+
+class OutboxDrainTest(TestCase):
+    """Ошибки SMTP не задерживают статистику и не блокируют outbox"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', email='author@example.com')
+        self.donor = User.objects.create_user('donor', email='bad@example.com')
+        self.collect = create_collect(self.author)
+        Payment.objects.create(
+            user=self.donor, collect=self.collect, amount=Decimal('100.00'),
+            payment_method=Payment.PaymentMethod.CARD,
+        )
+        self.send_messages = EmailBackend.send_messages
+
+    def drain(self, error):
+        """drain_outbox с ошибкой SMTP на письмах донатеру"""
+        def send_messages(backend, messages):
+            if messages[0].to == [self.donor.email]:
+                raise error
+            return self.send_messages(backend, messages)
+
+        with mock.patch.object(EmailBackend, 'send_messages', autospec=True, side_effect=send_messages), \
+                self.captureOnCommitCallbacks(execute=True):
+            return drain_outbox()
+
+    def test_refused_recipient_does_not_block_outbox(self):
+        with self.assertLogs('api.tasks', 'ERROR'):
+            self.drain(smtplib.SMTPRecipientsRefused({self.donor.email: (550, b'No such user')}))
+
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(CollectDailyStat.objects.get(collect=self.collect).payments_count, 1)
+        self.assertEqual([message.to for message in mail.outbox], [[self.author.email]] * 2)
+
+    def test_temporary_failure_keeps_stats_and_resends_only_undelivered(self):
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            self.drain(smtplib.SMTPServerDisconnected())
+
+        self.assertEqual(CollectDailyStat.objects.get(collect=self.collect).payments_count, 1)
+        self.assertFalse(OutboxEvent.objects.pending().exists())
+        self.assertTrue(OutboxEvent.objects.undelivered().exists())
+
+        drain_outbox()
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(CollectDailyStat.objects.get(collect=self.collect).payments_count, 1)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            [self.author.email, self.author.email, self.donor.email],
+        )
+
+
+class TrendingRefreshTest(TestCase):
+    """Сумма за окно тренда берется из почасовых сумм, а не из платежей"""
+
+    def setUp(self):
+        author = User.objects.create_user('author')
+        self.hot, self.cold = create_collect(author, title='Горячий'), create_collect(author, title='Холодный')
+        for collect, amount in ((self.hot, '300.00'), (self.hot, '200.00'), (self.cold, '50.00')):
+            Payment.objects.create(collect=collect, amount=Decimal(amount), payment_method=Payment.PaymentMethod.SBP)
+        with self.captureOnCommitCallbacks(execute=True):
+            drain_outbox()
+
+    def test_trending_from_hourly_amounts(self):
+        CollectRanking.objects.refresh()
+        self.assertEqual(
+            list(CollectRanking.objects.trending().values_list('collect_id', 'trending_amount_cents')),
+            [(self.hot.pk, 50000), (self.cold.pk, 5000)],
+        )
+
+        # Час выпал из окна: сбор уходит из ленты, а строка часа удаляется
+        CollectHourlyAmount.objects.filter(collect=self.cold).update(
+            hour=timezone.now() - timedelta(days=2)
+        )
+        CollectRanking.objects.refresh(since=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(
+            list(CollectRanking.objects.trending().values_list('collect_id', flat=True)),
+            [self.hot.pk],
+        )
+        self.assertFalse(CollectHourlyAmount.objects.filter(collect=self.cold).exists())
@@ -1,43 +1,280 @@
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
-from rest_framework import viewsets, mixins
-from .models import Collect, Payment
+import uuid
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from rest_framework import status, viewsets, mixins
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+from .cache import (
+    COLLECTS_TAG,
+    PAYMENTS_TAG,
+    RANKINGS_TAG,
+    cache_response,
+    collect_payments_tag,
+    collect_stats_tag,
+    collect_tag,
+    payment_tag,
+    response_items,
+)
+from .exports import EXPORT_FORMATS, aiter_in_thread, payment_export_rows
+from .filters import CollectFilterBackend, parse_occasions
+from .images import LimitedUploadHandler
+from .metrics import render as render_metrics
+from .mixins import CachedObjectsMixin, ReplicaReadMixin, SparseFieldsetsMixin
+from .models import Collect, CollectDailyStat, CollectRanking, Payment
+from .pagination import FeedPagination
 from .serializers import (
+    CollectListSerializer,
     CollectSimpleSerializer,
     PaymentSimpleSerializer
 )
 
 
-class CollectViewSet(viewsets.ModelViewSet):
+def collect_list_static_tags(view):
+    """Состав списка сборов известен до чтения страницы"""
+    return [COLLECTS_TAG]
+
+
+def collect_list_tags(view, data):
+    """Кроме состава, список зависит от каждого сбора на странице"""
+    return [collect_tag(item['id']) for item in response_items(data)]
+
+
+def collect_detail_tags(view, data):
+    return [collect_tag(data['id'])]
+
+
+def collect_stats_tags(view):
+    """Статистика обновляется обработчиком outbox, а не сохранением платежа"""
+    try:
+        return [collect_stats_tag(uuid.UUID(view.kwargs['pk']))]
+    except ValueError:
+        return []
+
+
+def collect_ranking_static_tags(view):
+    """Лента меняется пересчетом рейтингов, карточки - изменением своих сборов"""
+    return [RANKINGS_TAG]
+
+
+def payment_list_static_tags(view):
+    """Список платежей сбора инвалидируется только платежами этого сбора"""
+    collect_id = view.get_collect_filter()
+    return [collect_payments_tag(collect_id) if collect_id else PAYMENTS_TAG]
+
+
+def payment_list_tags(view, data):
+    return [payment_tag(item['id']) for item in response_items(data)]
+
+
+def payment_detail_tags(view, data):
+    """В платеже только id сбора, поэтому платежи в тот же сбор его не инвалидируют"""
+    return [payment_tag(data['id'])]
+
+
+class CollectViewSet(ReplicaReadMixin, SparseFieldsetsMixin, CachedObjectsMixin, viewsets.ModelViewSet):
     """
-    ViewSet для работы с групповыми сборами
+    ViewSet для работы с групповыми сборами.
+    Список и ленты trending/near-goal отдаются в компактном виде, поля
+    можно выбрать через ?fields= и ?omit=, список поддерживает поиск и фильтры
     """
-    queryset = Collect.objects.all()
+    queryset = Collect.objects.with_counters()
     serializer_class = CollectSimpleSerializer
+    pagination_class = FeedPagination
+    filter_backends = [CollectFilterBackend]
+    object_tag = staticmethod(collect_tag)
+    sparse_actions = ('list', 'retrieve', 'trending', 'near_goal')
+    replica_actions = ('list', 'retrieve', 'stats', 'trending', 'near_goal', 'export_payments')
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'trending', 'near_goal'):
+            return CollectListSerializer
+        return super().get_serializer_class()
 
-    @method_decorator(cache_page(60 * 5))
+    def initialize_request(self, request, *args, **kwargs):
+        """Обложки пишутся на диск потоком с ограничением размера"""
+        request.upload_handlers = [LimitedUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    @cache_response(60 * 5, tags=collect_list_tags, static_tags=collect_list_static_tags)
     def list(self, request, *args, **kwargs):
         """Список сборов с кэшированием"""
         return super().list(request, *args, **kwargs)
 
-    @method_decorator(cache_page(60 * 5))
+    @cache_response(60 * 5, tags=collect_detail_tags)
     def retrieve(self, request, *args, **kwargs):
         """Детали сбора с кэшированием"""
         return super().retrieve(request, *args, **kwargs)
 
+    def _parse_date_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        date = parse_date(value)
+        if date is None:
+            raise ValidationError({name: 'Ожидается дата в формате ГГГГ-ММ-ДД'})
+        return date
+
+    def _ranking_response(self, rankings):
+        """
+        Первые ?limit= сборов ленты (по умолчанию PAGE_SIZE, максимум
+        RANKING_MAX_LIMIT) с фильтром ?occasion=birthday,wedding
+        """
+        occasions = parse_occasions(self.request.query_params)
+        if occasions:
+            rankings = rankings.filter(occasion__in=occasions)
+
+        limit = self.request.query_params.get('limit') or settings.REST_FRAMEWORK['PAGE_SIZE']
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValidationError({'limit': 'Ожидается целое число'})
+        if not 1 <= limit <= settings.RANKING_MAX_LIMIT:
+            raise ValidationError({'limit': f'Допустимо от 1 до {settings.RANKING_MAX_LIMIT}'})
+
+        pks = list(rankings.values_list('collect_id', flat=True)[:limit])
+        return Response(self.get_serialized_objects(pks))
+
+    @action(detail=False, methods=['get'])
+    @cache_response(60, tags=collect_list_tags, static_tags=collect_ranking_static_tags)
+    def trending(self, request):
+        """Активные сборы с наибольшей суммой платежей за последние TRENDING_WINDOW секунд"""
+        return self._ranking_response(CollectRanking.objects.trending())
+
+    @action(detail=False, methods=['get'], url_path='near-goal')
+    @cache_response(60, tags=collect_list_tags, static_tags=collect_ranking_static_tags)
+    def near_goal(self, request):
+        """Активные сборы с целью, ближе всего подошедшие к целевой сумме"""
+        return self._ranking_response(CollectRanking.objects.near_goal())
+
+    @action(detail=True, methods=['get'])
+    @cache_response(60 * 5, static_tags=collect_stats_tags)
+    def stats(self, request, pk=None):
+        """
+        Статистика платежей сбора по дням и способам оплаты.
+        Читается из дневных агрегатов, фильтры: ?date_from=, ?date_to=
+        """
+        collect = get_object_or_404(Collect.objects.only('pk'), pk=pk)
+        stats = CollectDailyStat.objects.filter(collect=collect)
+        date_from, date_to = self._parse_date_param('date_from'), self._parse_date_param('date_to')
+        if date_from:
+            stats = stats.filter(day__gte=date_from)
+        if date_to:
+            stats = stats.filter(day__lte=date_to)
+
+        days, methods = {}, {}
+        total = {'amount_cents': 0, 'payments_count': 0, 'contributors': 0}
+        for row in stats.values('day', 'payment_method', 'amount_cents', 'payments_count', 'contributors'):
+            day = days.setdefault(row['day'], {'day': row['day'], **dict.fromkeys(total, 0)})
+            method = methods.setdefault(
+                row['payment_method'],
+                {'payment_method': row['payment_method'], **dict.fromkeys(total, 0)},
+            )
+            for field in total:
+                day[field] += row[field]
+                method[field] += row[field]
+                total[field] += row[field]
+
+        return Response({
+            'total': total,
+            'days': list(days.values()),
+            'payment_methods': sorted(methods.values(), key=lambda item: -item['amount_cents']),
+        })
+
+    @action(detail=True, methods=['get'], url_path='payments/export')
+    def export_payments(self, request, pk=None):
+        """
+        Потоковая выгрузка всех платежей сбора: ?output=csv (по умолчанию)
+        или ?output=ndjson. Платежи читаются серверным курсором пачками,
+        поэтому память не зависит от их количества ни под WSGI, ни под ASGI.
+        """
+        output = request.query_params.get('output', 'csv')
+        if output not in EXPORT_FORMATS:
+            raise ValidationError({'output': f"Допустимые форматы: {', '.join(EXPORT_FORMATS)}"})
+        stream, content_type = EXPORT_FORMATS[output]
 
-class PaymentViewSet(mixins.CreateModelMixin, mixins.ListModelMixin,
+        collect = get_object_or_404(Collect.objects.only('pk'), pk=pk)
+        payments = Payment.objects.filter(collect=collect).order_by('created_at', 'id')
+        # Запросы выполняются уже после выхода из представления, когда роутер
+        # снова читает с primary, поэтому БД фиксируется сейчас
+        payments = payments.using(payments.db)
+
+        content = stream(payment_export_rows(payments, settings.EXPORT_CHUNK_SIZE))
+        if isinstance(request._request, ASGIRequest):
+            content = aiter_in_thread(content)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="collect-{collect.pk}-payments.{output}"'
+        return response
+
+
+class PaymentViewSet(ReplicaReadMixin, CachedObjectsMixin, mixins.CreateModelMixin, mixins.ListModelMixin,
                      mixins.RetrieveModelMixin, viewsets.GenericViewSet):
     """
     ViewSet для работы с групповыми сборами
     """
     queryset = Payment.objects.all()
     serializer_class = PaymentSimpleSerializer
+    pagination_class = FeedPagination
+    object_tag = staticmethod(payment_tag)
+
+    def get_collect_filter(self):
+        """Идентификатор сбора из ?collect=<id>"""
+        collect_id = self.request.query_params.get('collect')
+        if not collect_id:
+            return None
+        try:
+            return uuid.UUID(collect_id)
+        except ValueError:
+            raise ValidationError({'collect': 'Некорректный идентификатор сбора'})
+
+    def get_queryset(self):
+        """Платежи можно отфильтровать по сбору"""
+        queryset = super().get_queryset()
+        collect_id = self.get_collect_filter()
+        if collect_id:
+            queryset = queryset.filter(collect_id=collect_id)
+        return queryset
 
-    @method_decorator(cache_page(60 * 2))
+    @cache_response(60 * 2, tags=payment_list_tags, static_tags=payment_list_static_tags)
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
-    @method_decorator(cache_page(60 * 2))
+    @cache_response(60 * 2, tags=payment_detail_tags)
     def retrieve(self, request, *args, **kwargs):
         return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Пакетное создание платежей.
+        Результат возвращается по каждому элементу в порядке запроса,
+        ошибки отдельных элементов не отменяют создание остальных.
+        """
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        created = serializer.save() if serializer.validated_data else []
+
+        created_data = iter(self.get_serializer(created, many=True).data)
+        results = []
+        for index in range(len(request.data)):
+            if index in serializer.item_errors:
+                results.append({'status': 'error', 'errors': serializer.item_errors[index]})
+            else:
+                results.append({'status': 'created', 'payment': next(created_data)})
+
+        if not created:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif serializer.item_errors:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_201_CREATED
+        return Response({'results': results}, status=response_status)
+
+
+def metrics(request):
+    """Метрики запросов и задач Celery в текстовом формате Prometheus"""
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,7 +1,15 @@
 import os
+import time
 from celery import Celery
+from celery.signals import before_task_publish
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'collect_service.settings')
 app = Celery('money_collect')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
+
+
+@before_task_publish.connect
+def add_published_at(headers=None, **kwargs):
+    """Время постановки в очередь для метрики ожидания задачи"""
+    headers['published_at'] = time.time()
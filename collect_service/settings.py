@@ -26,6 +26,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.db_router.PrimaryPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,6 +55,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'collect_service.wsgi.application'
+ASGI_APPLICATION = 'collect_service.asgi.application'
 
 
 DATABASES = {
@@ -63,9 +66,59 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'postgres'),
         'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
         'PORT': os.getenv('POSTGRES_PORT', '5432'),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Async-представления чтения нужны только под ASGI: под WSGI каждое из них
+# запускало бы свой event loop
+ASYNC_READ_VIEWS = os.getenv('WEB_SERVER', 'runserver') == 'asgi'
+
+# Пул соединений psycopg3 на процесс: соединения открываются заранее и
+# переиспользуются между запросами. Размер пула - см. README (ASGI-режим).
+# Без пула соединение держится CONN_MAX_AGE секунд, но под ASGI запросы
+# выполняются в разных потоках и постоянные соединения копились бы
+# по одному на поток, поэтому там без пула соединение закрывается после запроса.
+DB_POOL = os.getenv('DB_POOL', 'false').lower() in ('1', 'true', 'yes')
+
+if DB_POOL:
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            # Сколько ждать свободного соединения, прежде чем вернуть ошибку
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        },
+    }
+elif ASYNC_READ_VIEWS:
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('CONN_MAX_AGE', '60'))
+
+# Реплики для чтения: хосты через запятую, формат host или host:port.
+# Остальные параметры подключения, включая пул, берутся у default.
+# list/retrieve читают с реплик (api.db_router.ReplicaRouter), запись идет на default.
+REPLICA_DATABASES = []
+for index, address in enumerate(filter(None, os.getenv('POSTGRES_REPLICA_HOSTS', '').split(','))):
+    host, _, port = address.strip().partition(':')
+    alias = f'replica_{index + 1}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        # В тестах реплика - то же соединение, что и default
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+
+# Сколько секунд после записи клиент читает с primary и сколько максимум
+# живет кэш, посчитанный на реплике по недавно измененным данным.
+# Должно быть больше типичного отставания реплик.
+REPLICA_LAG_WINDOW = int(os.getenv('REPLICA_LAG_WINDOW', '5'))
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -102,6 +155,22 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
 }
 
+# Максимальный размер пакета в POST /payments/batch/
+PAYMENT_BATCH_MAX_SIZE = int(os.getenv('PAYMENT_BATCH_MAX_SIZE', '500'))
+
+# Помесячное секционирование api_payment в PostgreSQL (миграция 0011 или
+# команда payment_partitions --convert) и сколько месяцев вперед держать секции
+PAYMENT_PARTITIONING = os.getenv('PAYMENT_PARTITIONING', 'false').lower() in ('1', 'true', 'yes')
+PAYMENT_PARTITIONS_AHEAD = int(os.getenv('PAYMENT_PARTITIONS_AHEAD', '3'))
+
+# Архивация платежей сборов, закрытых больше PAYMENT_ARCHIVE_AFTER_DAYS дней
+# назад: файлы CSV.gz в PAYMENT_ARCHIVE_DIR
+PAYMENT_ARCHIVE_AFTER_DAYS = int(os.getenv('PAYMENT_ARCHIVE_AFTER_DAYS', '365'))
+PAYMENT_ARCHIVE_DIR = os.getenv('PAYMENT_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+
+# Платежей в одной выборке серверного курсора при выгрузке /collects/{id}/payments/export/
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "Money collect service API",
     "VERSION": "0.0.1",
@@ -112,19 +181,45 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-        'TIMEOUT': 60 * 5,  # 5 минут
+# Общий для всех воркеров кэш в Redis. Без REDIS_CACHE_URL (локально и в тестах)
+# используется LocMemCache отдельного процесса.
+REDIS_CACHE_URL = os.getenv('REDIS_CACHE_URL')
+
+if REDIS_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_CACHE_URL,
+            'TIMEOUT': 60 * 5,  # 5 минут
+            'KEY_PREFIX': 'money_collect',
+        }
     }
-}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+            'TIMEOUT': 60 * 5,  # 5 минут
+        }
+    }
+
+# Живой прогресс сборов (GET /collects/{id}/live/, только ASGI): Redis для
+# pub/sub, не больше LIVE_UPDATES_PER_SECOND обновлений в секунду на воркер
+# и комментарий-heartbeat раз в LIVE_HEARTBEAT_SECONDS секунд
+LIVE_REDIS_URL = os.getenv('LIVE_REDIS_URL', REDIS_CACHE_URL)
+LIVE_UPDATES_PER_SECOND = float(os.getenv('LIVE_UPDATES_PER_SECOND', '2'))
+LIVE_HEARTBEAT_SECONDS = int(os.getenv('LIVE_HEARTBEAT_SECONDS', '15'))
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.getenv("EMAIL_HOST", "localhost")
 EMAIL_PORT = os.getenv("MAILDEV_SMTP_PORT", "1025")
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "noreply@collect_service.com")
 
+# Окно дайджеста для авторов в секундах: вместо письма на каждый платеж
+# автор получает одно письмо "N новых платежей за последние M минут".
+# 0 - дайджест выключен
+NOTIFICATION_DIGEST_WINDOW = int(os.getenv("NOTIFICATION_DIGEST_WINDOW", "0"))
+
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/1")
 
@@ -132,3 +227,55 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = "UTC"
+
+CELERY_BEAT_SCHEDULE = {
+    'rollup-collect-counters': {
+        'task': 'api.tasks.rollup_collect_counters',
+        'schedule': 60.0,
+    },
+    'close-finished-collects': {
+        'task': 'api.tasks.close_finished_collects',
+        'schedule': 60.0,
+    },
+    'drain-outbox': {
+        'task': 'api.tasks.drain_outbox',
+        'schedule': float(os.getenv('OUTBOX_DRAIN_INTERVAL', '5')),
+    },
+    'create-payment-partitions': {
+        'task': 'api.tasks.create_payment_partitions',
+        'schedule': 24 * 60 * 60.0,
+    },
+    'refresh-collect-rankings': {
+        'task': 'api.tasks.refresh_collect_rankings',
+        'schedule': float(os.getenv('RANKINGS_REFRESH_INTERVAL', '60')),
+    },
+}
+
+# Ленты /collects/trending/ и /collects/near-goal/: окно суммы платежей для
+# тренда в секундах и интервал пересчета рейтингов
+TRENDING_WINDOW = int(os.getenv('TRENDING_WINDOW', str(24 * 60 * 60)))
+RANKINGS_REFRESH_INTERVAL = int(os.getenv('RANKINGS_REFRESH_INTERVAL', '60'))
+# Максимум сборов в одном ответе ленты (?limit=)
+RANKING_MAX_LIMIT = 100
+
+# Размер пачки событий outbox и максимум пачек за один запуск drain_outbox
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '200'))
+OUTBOX_MAX_BATCHES = int(os.getenv('OUTBOX_MAX_BATCHES', '50'))
+
+# Количество шардов счетчиков на сбор: столько платежей в один сбор
+# могут обновлять счетчики параллельно без ожидания блокировки строки
+COLLECT_COUNTER_SHARDS = int(os.getenv('COLLECT_COUNTER_SHARDS', '16'))
+
+# Метрики запросов и задач (Server-Timing и /metrics). Процессы копят
+# приращения в памяти и сбрасывают их в общий кэш раз в METRICS_FLUSH_INTERVAL секунд
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '10'))
+
+# Загрузка обложек: максимальный размер файла в байтах и сторона изображения
+# в пикселях. Варианты обложки: имя -> ширина в пикселях
+UPLOAD_MAX_FILE_SIZE = int(os.getenv('UPLOAD_MAX_FILE_SIZE', str(10 * 1024 * 1024)))
+COVER_IMAGE_MAX_DIMENSION = int(os.getenv('COVER_IMAGE_MAX_DIMENSION', '6000'))
+COVER_IMAGE_VARIANTS = {
+    'thumbnail': 320,
+    'medium': 960,
+}
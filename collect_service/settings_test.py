@@ -0,0 +1,32 @@
+"""
+Настройки для тестов без PostgreSQL, Redis и SMTP:
+    python manage.py test --settings=collect_service.settings_test
+"""
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test.sqlite3',  # noqa: F405
+    },
+    # Вторая база для проверки ReplicaRouter: в тестах - отдельное соединение
+    # к базе default, реплики включаются через REPLICA_DATABASES в самом тесте
+    'replica_1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_replica.sqlite3',  # noqa: F405
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+REPLICA_DATABASES = []
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests',
+    }
+}
+LIVE_REDIS_URL = None
+
+CELERY_TASK_ALWAYS_EAGER = True
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
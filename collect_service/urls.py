@@ -3,10 +3,11 @@ from django.urls import path, include
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 from django.conf import settings
 from django.conf.urls.static import static
-from rest_framework import routers
-from api.views import CollectViewSet, PaymentViewSet
+from api.async_views import AsyncReadRouter
+from api.live import collect_progress_stream
+from api.views import CollectViewSet, PaymentViewSet, metrics
 
-router = routers.DefaultRouter()
+router = AsyncReadRouter()
 router.register(r'collects', CollectViewSet)
 router.register(r'payments', PaymentViewSet)
 
@@ -14,6 +15,8 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path("schema/", SpectacularAPIView.as_view(), name="schema"),
     path("docs/", SpectacularSwaggerView.as_view(url_name="schema"), name="swagger-ui"),
+    path("metrics", metrics, name="metrics"),
+    path('collects/<uuid:pk>/live/', collect_progress_stream, name='collect-live'),
     path('', include(router.urls)),
 ]
 
@@ -27,6 +27,14 @@ else:
     print("Суперпользователь уже существует.")
 EOF
 
+    if [ "${WEB_SERVER:-runserver}" = "asgi" ]; then
+        echo "Запуск ASGI-сервера (gunicorn + uvicorn), воркеров: ${WEB_WORKERS:-4}..."
+        exec gunicorn collect_service.asgi:application \
+            --worker-class uvicorn_worker.UvicornWorker \
+            --workers "${WEB_WORKERS:-4}" \
+            --bind 0.0.0.0:8000
+    fi
+
     echo "Запуск сервера Django..."
     exec python manage.py runserver 0.0.0.0:8000
 
@@ -35,6 +43,11 @@ elif [ "$1" = "celery" ]; then
     echo "Запуск Celery воркера..."
     exec celery -A collect_service worker "$@"
 
+elif [ "$1" = "celery-beat" ]; then
+    shift
+    echo "Запуск Celery beat..."
+    exec celery -A collect_service beat "$@"
+
 else
     echo "Неизвестная команда, выполнение: $@"
     exec "$@"